@@ -0,0 +1,15 @@
+import logging
+
+from main import Main
+from program.other.benchmark import Benchmark
+
+# measures how fast domains are processed, using a local server instead of google and real websites.
+# for example: python3 benchmark.py --domains 500 --pageKilobytes 100 --latency 50 --captchaRate 0.05
+if __name__ == '__main__':
+    main = Main()
+
+    # only show the report
+    main.loggerHandlers['streamHandler'].setLevel(logging.WARNING)
+
+    benchmark = Benchmark(main.options)
+    benchmark.run()
@@ -16,8 +16,16 @@ class Main:
         self.log.info('Starting')
 
         try:
+            # for example --workers 16 to use 16 processes
+            self.options['workers'] = int(helpers.getParameter('--workers', False, self.options['workers']))
+
             keywordFinder = KeywordFinder(self.options, self.credentials)
-            keywordFinder.run()
+
+            # for example --keywordReport 30 to show how many domains had each keyword in the last 30 days
+            if '--keywordReport' in sys.argv:
+                keywordFinder.logKeywordReport(int(helpers.getParameter('--keywordReport', False, '30')))
+            else:
+                keywordFinder.run()
         except Exception as e:
             helpers.handleException(e)
         
@@ -31,10 +39,35 @@ class Main:
         self.options = {
             'inputFile': 'user-data/input/input.csv',
             'outputFile': 'user-data/output/output.csv',
+            'keywordsFile': 'user-data/input/keywords.txt',
+            'keywordsCaseSensitiveFile': 'user-data/input/keywords-case-sensitive.txt',
+            'databaseFile': 'user-data/database.sqlite',
+            'databaseType': 'sqlite',
             'daysBetweenDuplicates': -1,
             'loggerName': self.log.name,
             'maximumDaysToKeepItems': 90,
-            'randomizeUserAgent': 1
+            'randomizeUserAgent': 1,
+            'concurrency': 1,
+            'workers': 1,
+            'useAsync': 0,
+            'maximumRequestsPerHost': 2,
+            'domainsPerSearch': 1,
+            'maximumQueryLength': 2000,
+            'connectionPoolHosts': 100,
+            'connectionPoolSize': 10,
+            'streamPages': 1,
+            'keywordBitmap': 0,
+            'maximumPageBytes': 5 * 1000 * 1000,
+            'matchVisibleTextOnly': 1,
+            'maximumTextBytes': 1000 * 1000,
+            'databaseBatchSize': 200,
+            'databaseBatchSeconds': 5,
+            'outputBatchSize': 100,
+            'outputBatchSeconds': 5,
+            'serpCacheHours': 7 * 24,
+            'serpCacheMaximumItems': 100 * 1000,
+            'pageCacheMegabytes': 500,
+            'pageCacheHours': 20
         }
 
         # read the options file
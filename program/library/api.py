@@ -1,22 +1,33 @@
 import sys
+import time
 import logging
 import os.path
 import random
 import json
 import urllib.parse
+import threading
+import http.cookiejar
+import codecs
 import requests
 
 from collections import OrderedDict
+from requests.adapters import HTTPAdapter
 
 if '--debug' in sys.argv:
     import helpers as helpers
+    from retry_policy import RetryPolicy
 
     from helpers import get
 else:
     from . import helpers
+    from .retry_policy import RetryPolicy
     
     from .helpers import get
 
+# shared by every Api object, so connections to the same host get reused. keyed by proxy configuration.
+sessions = {}
+sessionsLock = threading.Lock()
+
 class Api:
     def get(self, url, parameters=None, responseIsJson=True, returnResponseObject=False):
         return self.request('GET', url, parameters, None, responseIsJson, returnResponseObject)
@@ -24,7 +35,10 @@ class Api:
     def post(self, url, data, responseIsJson=True, returnResponseObject=False, parameters=None):
         return self.request('POST', url, parameters, data, responseIsJson, returnResponseObject)
 
-    def request(self, requestType, url, parameters=None, data=None, responseIsJson=True, returnResponseObject=False):
+    def request(self, requestType, url, parameters=None, data=None, responseIsJson=True, returnResponseObject=False, stream=False):
+        if self.pageCache and requestType == 'GET' and not returnResponseObject and not stream and not '--debug' in sys.argv:
+            return self.requestWithCache(url, parameters, responseIsJson)
+
         result = None
         self.error = False
         self.lastStatusCode = None
@@ -41,30 +55,66 @@ class Api:
         for i in range(0, maximumTries):
             self.error = False
 
-            result = self.tryRequest(requestType, url, parameters, data, responseIsJson, returnResponseObject)
+            result = self.tryRequest(requestType, url, parameters, data, responseIsJson, returnResponseObject, stream)
 
-            if self.error:
-                self.log.debug(f'Try {i + 1} of {self.maximumTries}')
-            else:
+            delay = self.getRetryDelay(i, maximumTries)
+
+            if delay is None:
                 break
 
+            # otherwise its connection is never given back to the pool
+            if stream and hasattr(result, 'close'):
+                result.close()
+
+            time.sleep(delay)
+
         return result
 
-    def tryRequest(self, requestType, url, parameters=None, data=None, responseIsJson=True, returnResponseObject=False):
+    # returns None if the last request shouldn't be tried again
+    def getRetryDelay(self, i, maximumTries):
+        if i + 1 >= maximumTries:
+            return None
+
+        exception = self.lastException
+
+        # for example the response wasn't valid json
+        if self.error and not exception and not self.lastStatusCode:
+            exception = Exception('Unknown error')
+
+        delay = self.retryPolicy.getDelay(i, exception, self.lastStatusCode, self.lastHeaders, self.retryOnErrorStatus)
+
+        if delay is not None:
+            self.log.debug(f'Try {i + 1} of {maximumTries}. Trying again in {helpers.fixedDecimals(delay, 1)} seconds.')
+
+        return delay
+
+    def tryRequest(self, requestType, url, parameters=None, data=None, responseIsJson=True, returnResponseObject=False, stream=False):
         result = ''
 
         if responseIsJson:
             result = {}
 
+        self.lastException = None
+        self.lastHeaders = None
+
         cacheResponse = self.handleDebug(requestType, url, parameters, data, responseIsJson, returnResponseObject)
 
         if cacheResponse:
             return cacheResponse
 
+        if self.rateLimiter:
+            self.rateLimiter.wait(self.urlPrefix + url, self.proxies)
+
+        headers = self.headers
+
+        if self.conditionalHeaders:
+            headers = OrderedDict(self.headers)
+            headers.update(self.conditionalHeaders)
+
         try:
-            response = requests.request(requestType, self.urlPrefix + url, params=parameters, headers=self.headers, data=data, proxies=self.proxies, timeout=self.timeout, verify=self.verify)
+            response = self.getSession().request(requestType, self.urlPrefix + url, params=parameters, headers=headers, data=data, proxies=self.proxies, timeout=self.timeout, verify=self.verify, stream=stream)
 
-            self.handleResponseLog(requestType, url, parameters, data, response)
+            self.handleResponseLog(requestType, url, parameters, data, response, stream)
             
             if returnResponseObject:
                 result = response
@@ -75,6 +125,7 @@ class Api:
         
         except Exception as e:
             self.error = True
+            self.lastException = e
             
             if 'Max retries exceeded with url' in str(e):
                 helpers.handleException(e, None, self.log.name, True)
@@ -83,11 +134,190 @@ class Api:
         
         return result
 
+    def getSession(self):
+        key = ''
+
+        if self.proxies:
+            key = json.dumps(self.proxies, sort_keys=True)
+
+        with sessionsLock:
+            session = sessions.get(key)
+
+            if not session:
+                session = self.makeSession()
+                sessions[key] = session
+
+        return session
+
+    def makeSession(self):
+        session = requests.Session()
+
+        # each request sends its own headers. keeping cookies would leak them between threads and sites.
+        # cookies set during a call's redirects still work. requests keeps them in that request's own jar.
+        session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+
+        # retries are handled in request()
+        adapter = HTTPAdapter(pool_connections=self.poolHosts, pool_maxsize=self.poolSize, max_retries=0)
+
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        return session
+
     def getPlain(self, url):
         result = self.get(url, None, False)
 
         return result
 
+    # gives the body to onText piece by piece as it arrives, instead of downloading all of it first.
+    # stops after maximumBytes or as soon as shouldStop() returns true. returns the number of bytes read.
+    def getStreaming(self, url, onText, maximumBytes=None, shouldStop=None):
+        bytesRead = 0
+
+        # the debug cache stores whole files
+        if '--debug' in sys.argv:
+            return self.getFromText(self.getPlain(url), onText, maximumBytes)
+
+        cacheEntry = None
+        fullUrl = self.urlPrefix + url
+
+        if self.pageCache:
+            cacheEntry = self.pageCache.getEntry(fullUrl)
+
+            if cacheEntry and self.pageCache.isFresh(cacheEntry, fullUrl):
+                self.log.debug(f'Using cached version of {fullUrl}')
+                return self.getFromText(self.pageCache.getBody(cacheEntry), onText, maximumBytes)
+
+            if cacheEntry:
+                self.conditionalHeaders = self.pageCache.getConditionalHeaders(cacheEntry)
+
+        try:
+            response = self.request('GET', url, None, None, False, True, stream=True)
+        finally:
+            self.conditionalHeaders = None
+
+        if response is None or not hasattr(response, 'iter_content'):
+            return bytesRead
+
+        if cacheEntry and response.status_code == 304:
+            response.close()
+
+            self.log.debug(f'{fullUrl} has not changed')
+            self.pageCache.refresh(cacheEntry, response.headers)
+
+            return self.getFromText(self.pageCache.getBody(cacheEntry), onText, maximumBytes)
+
+        # written to the cache as it arrives. only a complete page is kept.
+        cacheItem = None
+
+        if self.pageCache and response.status_code == 200:
+            cacheItem = self.pageCache.startStore(fullUrl, response.headers)
+
+        try:
+            decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+        except LookupError:
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+        complete = True
+
+        try:
+            for chunk in response.iter_content(chunk_size=self.streamChunkSize):
+                if maximumBytes and bytesRead + len(chunk) >= maximumBytes:
+                    chunk = chunk[0:maximumBytes - bytesRead]
+                    
+                    self.log.debug(f'Stopped reading {url} after {maximumBytes} bytes')
+
+                    bytesRead += len(chunk)
+                    onText(decoder.decode(chunk))
+                    complete = False
+                    break
+
+                bytesRead += len(chunk)
+                text = decoder.decode(chunk)
+                onText(text)
+
+                if cacheItem:
+                    cacheItem['file'].write(text)
+
+                if shouldStop and shouldStop():
+                    self.log.debug(f'Stopped reading {url} early after {bytesRead} bytes')
+                    complete = False
+                    break
+
+            text = decoder.decode(b'', final=True)
+            onText(text)
+
+            if cacheItem and complete:
+                cacheItem['file'].write(text)
+                self.pageCache.finishStore(cacheItem)
+                cacheItem = None
+        except Exception as e:
+            self.error = True
+            helpers.handleException(e, f'Error while reading {url}', self.log.name)
+        finally:
+            # if the body wasn't fully read this drops the connection instead of reusing it
+            response.close()
+
+            if cacheItem:
+                self.pageCache.discardStore(cacheItem)
+
+        return bytesRead
+
+    def getFromText(self, page, onText, maximumBytes):
+        if maximumBytes:
+            page = page[0:maximumBytes]
+
+        onText(page)
+
+        return len(page)
+
+    def requestWithCache(self, url, parameters, responseIsJson):
+        result = ''
+
+        fullUrl = self.urlPrefix + url
+
+        if parameters:
+            fullUrl += '?' + urllib.parse.urlencode(parameters)
+
+        cacheEntry = self.pageCache.getEntry(fullUrl)
+
+        if cacheEntry and self.pageCache.isFresh(cacheEntry, fullUrl):
+            self.log.debug(f'Using cached version of {fullUrl}')
+
+            self.error = False
+            result = self.pageCache.getBody(cacheEntry)
+        else:
+            if cacheEntry:
+                self.conditionalHeaders = self.pageCache.getConditionalHeaders(cacheEntry)
+
+            try:
+                response = self.request('GET', url, parameters, None, False, True)
+            finally:
+                self.conditionalHeaders = None
+
+            if not hasattr(response, 'status_code'):
+                result = ''
+            elif cacheEntry and response.status_code == 304:
+                self.log.debug(f'{fullUrl} has not changed')
+
+                self.pageCache.refresh(cacheEntry, response.headers)
+                result = self.pageCache.getBody(cacheEntry)
+            else:
+                result = response.text
+
+                if response.status_code == 200:
+                    self.pageCache.store(fullUrl, response.headers, result)
+
+        if responseIsJson:
+            try:
+                result = json.loads(result)
+            except Exception as e:
+                self.error = True
+                helpers.handleException(e, None, self.log.name)
+                result = {}
+
+        return result
+
     def getFinalUrl(self, url):
         if not url:
             return url
@@ -175,14 +405,19 @@ class Api:
         else:
             return result
 
-    def handleResponseLog(self, requestType, url, parameters, data, response):
+    def handleResponseLog(self, requestType, url, parameters, data, response, stream=False):
         # got a response. it might be an error status code.
         self.error = False
         self.lastStatusCode = response.status_code
+        self.lastHeaders = response.headers
 
         self.log.debug(f'Response code: {response.status_code}')
         self.log.debug(f'Response headers: {response.headers}')
 
+        # reading the text here would download the whole body
+        if stream:
+            return
+
         if response.text != None:
             self.log.debug(f'Response: {response.text[0:500]}...')
 
@@ -422,6 +657,25 @@ class Api:
         self.usedHarFile = False
         self.lastStatusCode = None
 
+        # number of hosts to keep connections for and number of connections per host
+        self.poolHosts = int(get(self.options, 'connectionPoolHosts') or 100)
+        self.poolSize = int(get(self.options, 'connectionPoolSize') or 10)
+        # every worker may be talking to the same host or proxy
+        self.poolSize = max(self.poolSize, int(get(self.options, 'concurrency') or 1))
+        self.streamChunkSize = 16 * 1024
+
+        # optional. a PageCache for get requests.
+        self.pageCache = None
+        self.conditionalHeaders = None
+        # optional. a RateLimiter shared by every worker.
+        self.rateLimiter = None
+        # decides which failures to try again. can be replaced by one shared by every worker.
+        self.retryPolicy = RetryPolicy(options)
+        # false if the caller handles error status codes itself
+        self.retryOnErrorStatus = True
+        self.lastException = None
+        self.lastHeaders = None
+
         self.randomizeHeaders()
 
         self.userAgentList = None
@@ -0,0 +1,366 @@
+import sys
+import json
+import codecs
+import asyncio
+import urllib.parse
+
+from collections import OrderedDict
+
+# pip packages
+import aiohttp
+
+if '--debug' in sys.argv:
+    import helpers as helpers
+    from api import Api
+
+    from helpers import get
+else:
+    from . import helpers
+    from .api import Api
+
+    from .helpers import get
+
+# one session per event loop, shared by every AsyncApi object on that loop
+sessions = {}
+
+class AsyncResponse:
+    # the parts of a requests response that the rest of the code uses
+    @property
+    def text(self):
+        encoding = self.encoding or 'utf-8'
+
+        try:
+            return self.content.decode(encoding, errors='replace')
+        except LookupError:
+            return self.content.decode('utf-8', errors='replace')
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def __bool__(self):
+        return self.ok
+
+    def __init__(self, response, content):
+        self.status_code = response.status
+        self.headers = response.headers
+        self.url = str(response.url)
+        self.encoding = response.charset
+        self.content = content
+
+class AsyncApi(Api):
+    # same as Api, but runs on an asyncio event loop. awaiting a request doesn't block other requests.
+    async def get(self, url, parameters=None, responseIsJson=True, returnResponseObject=False):
+        return await self.request('GET', url, parameters, None, responseIsJson, returnResponseObject)
+
+    async def post(self, url, data, responseIsJson=True, returnResponseObject=False, parameters=None):
+        return await self.request('POST', url, parameters, data, responseIsJson, returnResponseObject)
+
+    # with "stream" the result is the aiohttp response before its body is read. the caller has to close it.
+    async def request(self, requestType, url, parameters=None, data=None, responseIsJson=True, returnResponseObject=False, stream=False):
+        if self.pageCache and requestType == 'GET' and not returnResponseObject and not stream and not '--debug' in sys.argv:
+            return await self.requestWithCache(url, parameters, responseIsJson)
+
+        result = None
+        self.error = False
+        self.lastStatusCode = None
+
+        self.setHeaders()
+
+        maximumTries = self.maximumTries
+
+        reliableDomains = get(self.options, 'reliableDomains').split(' ')
+
+        if reliableDomains and helpers.getDomainName(self.urlPrefix) in reliableDomains:
+            maximumTries = self.smallerMaximumTries
+
+        for i in range(0, maximumTries):
+            self.error = False
+
+            result = await self.tryRequest(requestType, url, parameters, data, responseIsJson, returnResponseObject, stream)
+
+            delay = self.getRetryDelay(i, maximumTries)
+
+            if delay is None:
+                break
+
+            # otherwise its connection is never given back
+            if stream and isinstance(result, aiohttp.ClientResponse):
+                result.close()
+
+            await asyncio.sleep(delay)
+
+        return result
+
+    async def tryRequest(self, requestType, url, parameters=None, data=None, responseIsJson=True, returnResponseObject=False, stream=False):
+        result = ''
+
+        if responseIsJson:
+            result = {}
+
+        self.lastException = None
+        self.lastHeaders = None
+
+        cacheResponse = self.handleDebug(requestType, url, parameters, data, responseIsJson, returnResponseObject)
+
+        if cacheResponse:
+            return cacheResponse
+
+        if self.rateLimiter:
+            await self.rateLimiter.waitAsync(self.urlPrefix + url, self.proxies)
+
+        try:
+            if stream:
+                async with self.getRequestSession() as session:
+                    response = await session.request(requestType, self.urlPrefix + url, **self.getRequestArguments(url, parameters, data))
+
+                self.handleResponseLog(requestType, url, parameters, data, AsyncResponse(response, None), stream)
+
+                return response
+
+            async with self.getRequestSession() as session:
+                async with session.request(requestType, self.urlPrefix + url, **self.getRequestArguments(url, parameters, data)) as response:
+                    content = await response.read()
+
+            response = AsyncResponse(response, content)
+
+            self.handleResponseLog(requestType, url, parameters, data, response)
+
+            if returnResponseObject:
+                result = response
+            elif responseIsJson:
+                result = json.loads(response.text)
+            else:
+                result = response.text
+
+        except Exception as e:
+            self.error = True
+            self.lastException = e
+
+            helpers.handleException(e, None, self.log.name)
+
+        return result
+
+    def getRequestArguments(self, url, parameters, data):
+        headers = OrderedDict(self.headers)
+
+        if self.conditionalHeaders:
+            headers.update(self.conditionalHeaders)
+
+        result = {
+            'params': parameters,
+            'headers': headers,
+            'data': data,
+            'timeout': aiohttp.ClientTimeout(sock_connect=self.timeout, sock_read=self.timeout)
+        }
+
+        if self.proxies:
+            fullUrl = self.urlPrefix + url
+
+            if fullUrl.startswith('https:'):
+                result['proxy'] = self.proxies.get('https')
+            else:
+                result['proxy'] = self.proxies.get('http')
+
+        if not self.verify:
+            result['ssl'] = False
+
+        return result
+
+    async def getPlain(self, url):
+        result = await self.get(url, None, False)
+
+        return result
+
+    # see Api.getStreaming. the cache's database and file work runs in a thread.
+    async def getStreaming(self, url, onText, maximumBytes=None, shouldStop=None):
+        bytesRead = 0
+
+        if '--debug' in sys.argv:
+            return self.getFromText(await self.getPlain(url), onText, maximumBytes)
+
+        cacheEntry = None
+        fullUrl = self.urlPrefix + url
+
+        if self.pageCache:
+            cacheEntry = await helpers.runInThread(self.pageCache.getEntry, fullUrl)
+
+            if cacheEntry and self.pageCache.isFresh(cacheEntry, fullUrl):
+                self.log.debug(f'Using cached version of {fullUrl}')
+                return self.getFromText(await helpers.runInThread(self.pageCache.getBody, cacheEntry), onText, maximumBytes)
+
+            if cacheEntry:
+                self.conditionalHeaders = self.pageCache.getConditionalHeaders(cacheEntry)
+
+        # tries again like any other request, until the body starts arriving
+        try:
+            response = await self.request('GET', url, None, None, False, True, stream=True)
+        finally:
+            self.conditionalHeaders = None
+
+        if not isinstance(response, aiohttp.ClientResponse):
+            return bytesRead
+
+        # written to the cache as it arrives. only a complete page is kept.
+        cacheItem = None
+
+        try:
+            if cacheEntry and response.status == 304:
+                self.log.debug(f'{fullUrl} has not changed')
+                await helpers.runInThread(self.pageCache.refresh, cacheEntry, response.headers)
+
+                return self.getFromText(await helpers.runInThread(self.pageCache.getBody, cacheEntry), onText, maximumBytes)
+
+            if self.pageCache and response.status == 200:
+                cacheItem = await helpers.runInThread(self.pageCache.startStore, fullUrl, response.headers)
+
+            try:
+                decoder = codecs.getincrementaldecoder(response.charset or 'utf-8')(errors='replace')
+            except LookupError:
+                decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+            complete = True
+
+            async for chunk in response.content.iter_chunked(self.streamChunkSize):
+                if maximumBytes and bytesRead + len(chunk) >= maximumBytes:
+                    chunk = chunk[0:maximumBytes - bytesRead]
+
+                    self.log.debug(f'Stopped reading {url} after {maximumBytes} bytes')
+
+                    bytesRead += len(chunk)
+                    onText(decoder.decode(chunk))
+                    complete = False
+                    break
+
+                bytesRead += len(chunk)
+                text = decoder.decode(chunk)
+                onText(text)
+
+                if cacheItem:
+                    cacheItem['file'].write(text)
+
+                if shouldStop and shouldStop():
+                    self.log.debug(f'Stopped reading {url} early after {bytesRead} bytes')
+                    complete = False
+                    break
+
+            text = decoder.decode(b'', final=True)
+            onText(text)
+
+            if cacheItem and complete:
+                cacheItem['file'].write(text)
+                await helpers.runInThread(self.pageCache.finishStore, cacheItem)
+                cacheItem = None
+        except Exception as e:
+            self.error = True
+            helpers.handleException(e, f'Error while reading {url}', self.log.name)
+        finally:
+            # otherwise the connection goes back to the pool with unread data
+            if response.content.at_eof():
+                response.release()
+            else:
+                response.close()
+
+            if cacheItem:
+                await helpers.runInThread(self.pageCache.discardStore, cacheItem)
+
+        return bytesRead
+
+    async def requestWithCache(self, url, parameters, responseIsJson):
+        result = ''
+
+        fullUrl = self.urlPrefix + url
+
+        if parameters:
+            fullUrl += '?' + urllib.parse.urlencode(parameters)
+
+        cacheEntry = await helpers.runInThread(self.pageCache.getEntry, fullUrl)
+
+        if cacheEntry and self.pageCache.isFresh(cacheEntry, fullUrl):
+            self.log.debug(f'Using cached version of {fullUrl}')
+
+            self.error = False
+            result = await helpers.runInThread(self.pageCache.getBody, cacheEntry)
+        else:
+            if cacheEntry:
+                self.conditionalHeaders = self.pageCache.getConditionalHeaders(cacheEntry)
+
+            try:
+                response = await self.request('GET', url, parameters, None, False, True)
+            finally:
+                self.conditionalHeaders = None
+
+            if not hasattr(response, 'status_code'):
+                result = ''
+            elif cacheEntry and response.status_code == 304:
+                self.log.debug(f'{fullUrl} has not changed')
+
+                await helpers.runInThread(self.pageCache.refresh, cacheEntry, response.headers)
+                result = await helpers.runInThread(self.pageCache.getBody, cacheEntry)
+            else:
+                result = response.text
+
+                if response.status_code == 200:
+                    await helpers.runInThread(self.pageCache.store, fullUrl, response.headers, result)
+
+        if responseIsJson:
+            try:
+                result = json.loads(result)
+            except Exception as e:
+                self.error = True
+                helpers.handleException(e, None, self.log.name)
+                result = {}
+
+        return result
+
+    async def getFinalUrl(self, url):
+        if not url:
+            return url
+
+        response = await self.get(url, None, False, returnResponseObject=True)
+
+        if not response or not hasattr(response, 'url'):
+            return url
+
+        result = response.url
+
+        # because the protocol can change in the above steps
+        if helpers.findBetween(result, '://', '') == helpers.findBetween(url, '://', ''):
+            # for javascript redirects
+            redirect = helpers.findBetween(response.text, 'location.replace("', '")', strict=True)
+
+            if redirect:
+                result = redirect.replace(r'\/', '/')
+
+        return result
+
+    def getSession(self):
+        loop = asyncio.get_running_loop()
+
+        session = sessions.get(loop)
+
+        if not session or session.closed:
+            # limit is the total number of connections
+            connector = aiohttp.TCPConnector(limit=self.poolHosts * self.poolSize, limit_per_host=self.poolSize)
+
+            # each request sends its own headers, like in Api
+            session = aiohttp.ClientSession(connector=connector, cookie_jar=aiohttp.DummyCookieJar(), trust_env=True)
+
+            sessions[loop] = session
+
+        return session
+
+    # a session for one call, so cookies set during its redirects are kept until the call ends but aren't
+    # sent to other sites. the connections still come from the shared pool.
+    def getRequestSession(self):
+        return aiohttp.ClientSession(connector=self.getSession().connector, connector_owner=False, cookie_jar=aiohttp.CookieJar(unsafe=True), trust_env=True)
+
+    # call before the event loop ends
+    @staticmethod
+    async def closeSessions():
+        loop = asyncio.get_running_loop()
+
+        session = sessions.pop(loop, None)
+
+        if session and not session.closed:
+            await session.close()
@@ -0,0 +1,39 @@
+import math
+import hashlib
+
+class BloomFilter:
+    # can say an item is definitely not in the set, or that it might be.
+    # uses about 10 bits per item for a 1% false positive rate.
+    def add(self, item):
+        for position in self.getPositions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+        self.count += 1
+
+    def getPositions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+
+        first = int.from_bytes(digest[0:8], 'little')
+        second = int.from_bytes(digest[8:16], 'little') | 1
+
+        for i in range(0, self.hashCount):
+            yield (first + i * second) % self.bitCount
+
+    def __contains__(self, item):
+        for position in self.getPositions(item):
+            if not self.bits[position >> 3] & (1 << (position & 7)):
+                return False
+
+        return True
+
+    def __len__(self):
+        return self.count
+
+    def __init__(self, expectedItems, falsePositiveRate=0.01):
+        expectedItems = max(expectedItems, 1)
+
+        self.bitCount = math.ceil(-expectedItems * math.log(falsePositiveRate) / (math.log(2) ** 2))
+        self.bitCount = max(self.bitCount, 64)
+        self.hashCount = max(1, round(self.bitCount / expectedItems * math.log(2)))
+        self.bits = bytearray((self.bitCount + 7) // 8)
+        self.count = 0
@@ -1,9 +1,13 @@
 import os
+import re
 import sys
 import sqlite3
 import logging
 import time
 import random
+import threading
+import atexit
+import contextlib
 
 if '--debug' in sys.argv:
     import helpers as helpers
@@ -15,27 +19,42 @@ else:
     from .helpers import get
 
 class Database:
-    def execute(self, statement, returnResult=False):
-        self.executeWithRetries(statement)
+    # writes go through one connection, one at a time. with sqlite each thread reads through its own
+    # connection. in wal mode those reads don't wait for the writer and the writer doesn't wait for them.
+    # values can be passed separately as "params", with a ? for each one in the statement. then the statement
+    # doesn't need escaping and sqlite can reuse it.
+    def execute(self, statement, returnResult=False, params=None):
+        if returnResult and self.isRead(statement):
+            return self.read(statement, params)
 
-        if not returnResult:
-            return
-        
-        try:
-            rows = self.cursor.fetchall()
+        with self.lock:
+            self.flushIfNeeded(statement)
 
-            result = []
-        
-            for row in rows:
-                result.append(dict(row))
+            self.executeWithRetries(statement, params)
 
-            return result
-        except Exception as e:
-            self.handleException(e)
+            if not returnResult:
+                return
+            
+            try:
+                rows = self.cursor.fetchall()
 
-    def get(self, table, columns='*', where=None, orderBy=None, orderType=None, limit=None):
-        result = []
+                result = []
+            
+                for row in rows:
+                    result.append(dict(row))
+
+                return result
+            except Exception as e:
+                self.handleException(e)
+
+    # runs the statement once for each item in paramsList
+    def executeMany(self, statement, paramsList):
+        with self.lock:
+            self.flushIfNeeded(statement)
 
+            self.executeWithRetries(statement, paramsList, True)
+
+    def get(self, table, columns='*', where=None, orderBy=None, orderType=None, limit=None, params=None):
         wherePart = ''
         orderByPart = ''
         limitPart = ''
@@ -49,24 +68,198 @@ class Database:
         if limit:
             limitPart = f' limit {limit}'
 
-        query = f'select {columns} from {table}{wherePart}{orderByPart}{limitPart};'
+        query = f'select {columns} from {self.quote(table)}{wherePart}{orderByPart}{limitPart};'
 
-        self.executeWithRetries(query)
+        return self.read(query, params)
 
-        try:
-            rows = self.cursor.fetchall()
+    # "flush" is false when the caller already checked the buffered rows
+    def read(self, query, params=None, flush=True):
+        result = []
+
+        if flush:
+            self.flushIfNeeded(query)
+
+        connection = self.getReadConnection()
+
+        if not connection:
+            with self.lock:
+                if flush:
+                    self.flushIfNeeded(query)
+
+                self.executeWithRetries(query, params)
+
+                try:
+                    rows = self.cursor.fetchall()
+
+                    for row in rows:
+                        result.append(dict(row))
+                except Exception as e:
+                    self.handleException(e)
+
+            return result
+
+        cursor = self.executeReadWithRetries(connection, query, params)
 
-            for row in rows:
+        if not cursor:
+            return result
+
+        try:
+            for row in cursor.fetchall():
                 result.append(dict(row))
         except Exception as e:
             self.handleException(e)
+        finally:
+            cursor.close()
 
         return result
 
-    def getFirst(self, table, columns, where, orderBy=None, orderType=None, mergeJsonColumn=False):
+    # yields rows one at a time instead of loading all of them
+    def iterate(self, statement, batchSize=1000, params=None):
+        self.flushIfNeeded(statement)
+
+        connection = self.getReadConnection()
+
+        # its own connection, so nothing else needs to wait while the rows are read
+        if connection:
+            cursor = self.executeReadWithRetries(connection, statement, params)
+
+            if not cursor:
+                return
+
+            try:
+                while True:
+                    rows = cursor.fetchmany(batchSize)
+
+                    if not rows:
+                        break
+
+                    for row in rows:
+                        yield dict(row)
+            finally:
+                cursor.close()
+
+            return
+
+        if self.type == 'mysql':
+            yield from self.iterateMySql(statement, params, batchSize)
+            return
+
+        with self.lock:
+            self.flushIfNeeded(statement)
+
+            # a separate cursor so other statements can run between batches
+            cursor = self.connection.cursor()
+
+            if params is None:
+                cursor.execute(statement)
+            else:
+                cursor.execute(self.getStatement(statement), params)
+
+        try:
+            while True:
+                with self.lock:
+                    rows = cursor.fetchmany(batchSize)
+
+                if not rows:
+                    break
+
+                for row in rows:
+                    yield dict(row)
+        finally:
+            cursor.close()
+
+    # mysql doesn't allow other statements on a connection while it has unread rows, so the rows are read
+    # with their own connection. then the writer's connection is free between batches, for example for the
+    # job lease heartbeat.
+    # it doesn't see what an unfinished transaction wrote. iterate() already wrote the buffered rows.
+    def iterateMySql(self, statement, params, batchSize):
+        connection = self.connectMySql(get(self.name, 'database'))
+        cursor = connection.cursor(dictionary=True)
+
+        try:
+            if params is None:
+                cursor.execute(statement)
+            else:
+                cursor.execute(self.getStatement(statement), params)
+
+            while True:
+                rows = cursor.fetchmany(batchSize)
+
+                if not rows:
+                    break
+
+                for row in rows:
+                    yield dict(row)
+        finally:
+            cursor.close()
+            connection.close()
+
+    def connectMySql(self, database=None):
+        import mysql.connector
+
+        name = self.name
+
+        return mysql.connector.connect(host=get(name, 'host'), port=int(get(name, 'port') or 3306), user=get(name, 'user'), passwd=get(name, 'password'), database=database)
+
+    # this thread's connection for reading, or None to use the writer's connection
+    def getReadConnection(self):
+        if not self.useReadConnections:
+            return None
+
+        # inside a transaction reads must see what it changed so far
+        if self.transactionThread == threading.get_ident():
+            return None
+
+        connection = getattr(self.threadData, 'connection', None)
+
+        if connection:
+            return connection
+
+        try:
+            connection = sqlite3.connect(self.name, timeout=self.busyTimeout, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            connection.execute('pragma query_only = 1')
+        except Exception as e:
+            self.handleException(e)
+            return None
+
+        self.threadData.connection = connection
+
+        with self.lock:
+            self.closeUnusedReadConnections()
+            self.readConnections[threading.current_thread()] = connection
+
+        return connection
+
+    # each run has a new thread pool, so the threads of earlier runs have ended
+    def closeUnusedReadConnections(self):
+        for thread in [thread for thread in self.readConnections if not thread.is_alive()]:
+            self.readConnections.pop(thread).close()
+
+    def executeReadWithRetries(self, connection, query, params=None):
+        maximumTries = 100
+
+        for i in range(0, maximumTries):
+            try:
+                return connection.execute(query, params or ())
+            except sqlite3.OperationalError as e:
+                if self.isLockError(e):
+                    logging.error(f'Database locked. Retrying. {i + 1} of {maximumTries}.')
+
+                    time.sleep(random.randrange(100, 1000) / 1000)
+                else:
+                    self.handleException(e)
+                    break
+
+        return None
+
+    def isRead(self, statement):
+        return statement.lstrip()[0:6].lower() == 'select'
+
+    def getFirst(self, table, columns, where, orderBy=None, orderType=None, mergeJsonColumn=False, params=None):
         result = {}
 
-        rows = self.get(table, columns, where, orderBy, orderType, 1)
+        rows = self.get(table, columns, where, orderBy, orderType, 1, params)
 
         if len(rows) > 0:
             result = rows[0]
@@ -77,26 +270,115 @@ class Database:
 
         return result
 
-    def executeWithRetries(self, query):
+    # the first row where each column in "values" has that value, or {}. looks at the buffered rows first, so it doesn't
+    # need to write them. "values" should have the primary key or columns that don't change when a row is replaced.
+    def find(self, table, columns, values):
+        with self.lock:
+            pendingInserts = [item for pendingTable, item in self.pendingInserts if pendingTable == table]
+
+        # the newest one replaces the others
+        for item in reversed(pendingInserts):
+            if all(item.get(column) == value for column, value in values.items()):
+                if columns == '*':
+                    return dict(item)
+
+                return {column: item.get(column) for column in self.getColumnNames(columns)}
+
+        where = ' and '.join([f'{self.quote(column)} = ?' for column in values])
+
+        rows = self.read(f'select {columns} from {self.quote(table)} where {where} limit 1;', tuple(values.values()), False)
+
+        if not rows:
+            return {}
+
+        return rows[0]
+
+    # for example "`key`, size" gives ['key', 'size']
+    def getColumnNames(self, columns):
+        return [column.strip().strip('`') for column in columns.split(',')]
+
+    # so reads see rows that are still buffered. only writes them if the statement uses a table that has some.
+    def flushIfNeeded(self, statement=None):
+        if not self.pendingInserts or self.transactionDepth:
+            return
+
+        if statement is not None and not self.usesPendingTable(statement):
+            return
+
+        self.flush()
+
+    def usesPendingTable(self, statement):
+        for table in self.pendingTables:
+            if re.search(r'\b' + re.escape(table) + r'\b', statement):
+                return True
+
+        return False
+
+    def executeWithRetries(self, query, params=None, many=False):
         maximumTries = 1000
 
+        if params is not None:
+            query = self.getStatement(query)
+
         for i in range(0, maximumTries):
             try:
-                self.cursor.execute(query)
+                if many:
+                    self.cursor.executemany(query, params)
+                elif params is not None:
+                    self.cursor.execute(query, params)
+                else:
+                    self.cursor.execute(query)
 
                 # if it's here it means it succeeded
                 break
-            except sqlite3.OperationalError as e:
-                if str(e) == 'database is locked':
+            except Exception as e:
+                if self.isLockError(e):
                     logging.error(f'Database locked. Retrying. {i + 1} of {maximumTries}.')
 
                     seconds = random.randrange(100, 1000) / 1000
                     time.sleep(seconds)
-                else:
+                elif self.isConnectionError(e) and i + 1 < maximumTries:
+                    logging.error(f'Lost the database connection. Reconnecting. {i + 1} of {maximumTries}.')
+
+                    self.reconnect()
+                elif isinstance(e, sqlite3.OperationalError):
                     self.handleException(e)
                     break
+                else:
+                    raise
+
+        if not self.transactionDepth:
+            self.connection.commit()
+
+    # another process or node has the row or table locked
+    def isLockError(self, e):
+        if isinstance(e, sqlite3.OperationalError):
+            return str(e) == 'database is locked'
+
+        # lock wait timeout. mysql only rolls back the statement, so it can be run again.
+        # a deadlock rolls back the whole transaction, so that's only retried outside one.
+        if self.type == 'mysql':
+            errorNumber = getattr(e, 'errno', None)
+
+            return errorNumber == 1205 or (errorNumber == 1213 and not self.transactionDepth)
 
-        self.connection.commit()
+        return False
+
+    # mysql closes connections that were idle for too long
+    def isConnectionError(self, e):
+        if self.type != 'mysql' or self.transactionDepth:
+            return False
+
+        return getattr(e, 'errno', None) in [2006, 2013, 2055]
+
+    def reconnect(self):
+        time.sleep(random.randrange(100, 1000) / 1000)
+
+        try:
+            self.connection.ping(reconnect=True, attempts=3, delay=1)
+            self.cursor = self.connection.cursor(dictionary=True, buffered=True)
+        except Exception as e:
+            self.handleException(e)
 
     def insert(self, table, toInsert):
         if not toInsert:
@@ -113,44 +395,197 @@ class Database:
             logging.debug(f'Inserting into {table}: {toInsert}')
             items.append(toInsert)
 
-        columns = []
+        with self.lock:
+            # inside a transaction everything is committed together anyway
+            if self.maximumPendingItems and not self.transactionDepth:
+                for item in items:
+                    self.pendingInserts.append((table, item))
 
-        for key in items[0]:
-            columns.append(key)
+                # a new set instead of changing it, because reads look at it without the lock
+                if table not in self.pendingTables:
+                    self.pendingTables = self.pendingTables | {table}
 
-        columns = ', '.join(columns)
+                if len(self.pendingInserts) >= self.maximumPendingItems or time.time() - self.lastFlush >= self.maximumPendingSeconds:
+                    self.flush()
 
-        groupsOfValues = []
+                return None
 
-        for item in items:            
-            values = []
-            
-            for key, value in item.items():
-                # escape single quotes
-                if isinstance(value, str):
-                    value = "'" + value.replace("'", "''") + "'"
-                elif value == None:
-                    value = 'null'
+            if len(items) > 1:
+                self.insertMany(table, items)
+                return None
+
+            columns = tuple(items[0].keys())
+
+            self.executeWithRetries(self.getInsertQuery(table, columns), self.getValues(items[0], columns))
+
+            return self.cursor.lastrowid
 
-                values.append(str(value))
+    # inserts the items in one transaction
+    def insertMany(self, table, items):
+        # items with the same columns can use the same statement
+        groups = {}
 
-            values = ', '.join(values)
-            values = f'({values})'
+        for item in items:
+            columns = tuple(item.keys())
+            groups.setdefault(columns, []).append(self.getValues(item, columns))
 
-            groupsOfValues.append(values)
+        with self.transaction():
+            for columns, rows in groups.items():
+                # sqlite runs the prepared statement once per row, so there's nothing to gain from longer statements
+                if self.type == 'sqlite':
+                    self.executeWithRetries(self.getInsertQuery(table, columns), rows, True)
+                    continue
 
-        groupsOfValues = ', '.join(groupsOfValues)
+                # mysql's executemany only combines "insert" statements, not "replace", so each row would be
+                # its own round trip. this sends as many rows per statement as the maximum packet size allows.
+                for chunk in self.getChunks(rows):
+                    params = tuple(value for row in chunk for value in row)
+
+                    self.executeWithRetries(self.getInsertQuery(table, columns, len(chunk)), params)
+
+    def getInsertQuery(self, table, columns, rowCount=1):
+        columnsString = ', '.join([self.quote(column) for column in columns])
+        placeholders = ', '.join(['?'] * len(columns))
+        values = ', '.join([f'({placeholders})'] * rowCount)
 
         query = ''
 
         if self.type == 'sqlite':
-            query = f'insert or replace into {table} ({columns}) values {groupsOfValues};'
+            query = f'insert or replace into {self.quote(table)} ({columnsString}) values {values};'
         elif self.type == 'mysql':
-            query = f'replace into {table} ({columns}) values {groupsOfValues};'
+            query = f'replace into {self.quote(table)} ({columnsString}) values {values};'
+
+        return query
+
+    def getValues(self, item, columns):
+        result = []
+
+        for column in columns:
+            value = item[column]
+
+            if value is not None and not isinstance(value, (str, int, float, bytes)):
+                value = str(value)
+
+            result.append(value)
+
+        return tuple(result)
+
+    # splits the rows so each statement stays under mysql's maximum packet size
+    def getChunks(self, rows):
+        chunk = []
+        size = 0
+
+        for row in rows:
+            # escaping can make strings longer, and each value has quotes and a comma
+            rowSize = sum([2 * len(value) + 3 if isinstance(value, (str, bytes)) else 24 for value in row]) + 4
+
+            if chunk and size + rowSize > self.maximumStatementBytes:
+                yield chunk
+
+                chunk = []
+                size = 0
+
+            chunk.append(row)
+            size += rowSize
+
+        if chunk:
+            yield chunk
+
+    # mysql uses %s instead of ?. a literal % has to be %%.
+    def getStatement(self, statement):
+        if self.type != 'mysql':
+            return statement
+
+        result = self.statements.get(statement)
+
+        if result is not None:
+            return result
+
+        characters = []
+        quote = None
+
+        for character in statement:
+            if quote:
+                if character == quote:
+                    quote = None
+            elif character in ["'", '"', '`']:
+                quote = character
+            elif character == '?':
+                characters.append('%s')
+                continue
+
+            if character == '%':
+                characters.append('%%')
+                continue
+
+            characters.append(character)
+
+        result = ''.join(characters)
+
+        if len(self.statements) < 1000:
+            self.statements[statement] = result
+
+        return result
+
+    # buffers inserts and writes them in one transaction after maximumItems inserts or maximumSeconds
+    def setWriteBehind(self, maximumItems=500, maximumSeconds=5):
+        self.maximumPendingItems = maximumItems
+        self.maximumPendingSeconds = maximumSeconds
+        self.lastFlush = time.time()
+
+        if not self.registeredExitHandler:
+            atexit.register(self.flush)
+            self.registeredExitHandler = True
+
+    def flush(self):
+        with self.lock:
+            self.lastFlush = time.time()
+
+            if not self.pendingInserts or not self.connection:
+                return
+
+            pendingInserts = self.pendingInserts
+            self.pendingInserts = []
+            self.pendingTables = set()
+
+            logging.debug(f'Writing {len(pendingInserts)} buffered rows')
+
+            # the rows for each table go in with executemany
+            itemsByTable = {}
+
+            for table, item in pendingInserts:
+                itemsByTable.setdefault(table, []).append(item)
 
-        self.executeWithRetries(query)
+            with self.transaction():
+                for table, items in itemsByTable.items():
+                    self.insertMany(table, items)
 
-        return self.cursor.lastrowid
+    # commits once at the end, or rolls back if there's an exception
+    @contextlib.contextmanager
+    def transaction(self):
+        with self.lock:
+            if not self.transactionDepth and self.pendingInserts:
+                self.flush()
+
+            self.transactionDepth += 1
+            self.transactionThread = threading.get_ident()
+
+            try:
+                yield self
+            except:
+                self.transactionDepth -= 1
+
+                if not self.transactionDepth:
+                    self.transactionThread = None
+                    self.connection.rollback()
+
+                raise
+            else:
+                self.transactionDepth -= 1
+
+                if not self.transactionDepth:
+                    self.transactionThread = None
+                    self.connection.commit()
 
     def makeTables(self, fileName):
         tables = helpers.getJsonFile(fileName)
@@ -158,23 +593,111 @@ class Database:
         for tableName in tables:
             table = tables[tableName]
 
-            columnList = []
-            columns = get(table, 'columns')
-            
-            for column in columns:
-                string = f'{column} {columns[column]}'
-                columnList.append(string)
+            self.execute(self.getCreateTableStatement(tableName, table))
+
+            self.addMissingColumns(tableName, table)
+            self.addMissingPrimaryKey(tableName, table)
+
+            for index in get(table, 'indexes') or []:
+                indexName = f'{tableName}_' + '_'.join(index)
+                indexColumns = ', '.join([self.quote(column) for column in index])
+
+                if self.type == 'mysql':
+                    # mysql doesn't have "create index if not exists"
+                    if self.get('information_schema.statistics', 'index_name', 'table_schema = database() and table_name = ? and index_name = ?', params=(tableName, indexName)):
+                        continue
+
+                    self.execute(f'create index {self.quote(indexName)} on {self.quote(tableName)} ({indexColumns})')
+                else:
+                    self.execute(f'create index if not exists {indexName} on {self.quote(tableName)} ({indexColumns})')
+
+    def getCreateTableStatement(self, tableName, table):
+        columnList = []
+        columns = get(table, 'columns')
+        primaryKeys = get(table, 'primaryKeys') or []
+        
+        for column in columns:
+            string = f'{self.quote(column)} {self.getColumnType(table, column)}'
+            columnList.append(string)
+
+        columnsString = ', '.join(columnList)
+
+        primaryKeysString = ', '.join([self.quote(column) for column in primaryKeys])
+
+        if primaryKeysString:
+            primaryKeysString = f', primary key({primaryKeysString})'
+
+        return f'create table if not exists {self.quote(tableName)} ( {columnsString}{primaryKeysString} )'
+
+    # mysql can't use text columns in keys and indexes and needs auto_increment to number the rows
+    def getColumnType(self, table, column):
+        result = get(table, 'columns')[column]
+
+        if self.type != 'mysql':
+            return result
+
+        primaryKeys = get(table, 'primaryKeys') or []
+        indexedColumns = primaryKeys + [item for index in get(table, 'indexes') or [] for item in index]
+
+        if result == 'text' and column in indexedColumns:
+            result = self.stringKeyType
+        elif result == 'integer' and primaryKeys == [column]:
+            result = 'integer auto_increment'
+
+        return result
+
+    # for tables that were made by an older version
+    def addMissingColumns(self, tableName, table):
+        if self.type == 'mysql':
+            rows = self.execute(f'show columns from {self.quote(tableName)}', True) or []
+            existingColumns = [get(row, 'Field') for row in rows]
+        else:
+            rows = self.execute(f'pragma table_info({self.quote(tableName)})', True) or []
+            existingColumns = [get(row, 'name') for row in rows]
+
+        for column in get(table, 'columns'):
+            if column in existingColumns:
+                continue
+
+            logging.info(f'Adding column {column} to table {tableName}')
+
+            self.execute(f'alter table {self.quote(tableName)} add column {self.quote(column)} {self.getColumnType(table, column)}')
+
+    # for tables that were made by an older version without a primary key. copies the rows to a new table
+    # that has one. a later row replaces an earlier one with the same key.
+    def addMissingPrimaryKey(self, tableName, table):
+        primaryKeys = get(table, 'primaryKeys') or []
+
+        if not primaryKeys:
+            return
+
+        if self.type == 'mysql':
+            rows = self.execute(f'show columns from {self.quote(tableName)}', True) or []
+            existingKeys = [get(row, 'Field') for row in rows if get(row, 'Key') == 'PRI']
+        else:
+            rows = self.execute(f'pragma table_info({self.quote(tableName)})', True) or []
+            existingKeys = [get(row, 'name') for row in rows if get(row, 'pk')]
+
+        if existingKeys:
+            return
 
-            columnsString = ', '.join(columnList)
+        logging.info(f'Adding a primary key to table {tableName}. Rows with the same key are combined.')
 
-            primaryKeys = get(table, 'primaryKeys')
-            primaryKeysString = ', '.join(primaryKeys)
+        newTableName = f'{tableName}New'
+        columnsString = ', '.join([self.quote(column) for column in get(table, 'columns')])
 
-            if primaryKeysString:
-                primaryKeysString = f', primary key({primaryKeysString})'
+        # the indexes are made again after this
+        with self.transaction():
+            self.execute(f'drop table if exists {self.quote(newTableName)}')
+            self.execute(self.getCreateTableStatement(newTableName, table))
 
-            statement = f'create table if not exists {tableName} ( {columnsString}{primaryKeysString} )'
-            self.execute(statement)
+            if self.type == 'mysql':
+                self.execute(f'replace into {self.quote(newTableName)} ({columnsString}) select {columnsString} from {self.quote(tableName)}')
+            else:
+                self.execute(f'insert or replace into {self.quote(newTableName)} ({columnsString}) select {columnsString} from {self.quote(tableName)} order by rowid')
+
+            self.execute(f'drop table {self.quote(tableName)}')
+            self.execute(f'alter table {self.quote(newTableName)} rename to {self.quote(tableName)}')
 
     def open(self, name):
         if not name:
@@ -182,19 +705,35 @@ class Database:
 
         try:
             if self.type == 'sqlite':
-                self.connection = sqlite3.connect(name)
+                # the lock below serializes access from worker threads. the timeout is how long to wait
+                # when another process is writing.
+                self.connection = sqlite3.connect(name, timeout=self.busyTimeout, check_same_thread=False)
                 # to get column names
                 self.connection.row_factory = sqlite3.Row
                 self.cursor = self.connection.cursor()
+
+                # lets other processes read while one writes
+                if name != ':memory:':
+                    self.cursor.execute('pragma journal_mode = wal')
+                    self.cursor.execute('pragma synchronous = normal')
+
+                    # each :memory: connection would be a different database
+                    self.useReadConnections = True
             elif self.type == 'mysql':
-                import mysql.connector                
-                
-                self.connection = mysql.connector.connect(host=get(name, 'host'), user=get(name, 'user'), passwd=get(name, 'password'))
+                self.connection = self.connectMySql()
                 # buffered part is because otherwise get "Unread result found" error when you connection.commit without cursor.fetchAll
                 self.cursor = self.connection.cursor(dictionary=True, buffered=True)
 
-                self.cursor.execute(f'CREATE DATABASE IF NOT EXISTS {get(name, "database")} CHARACTER SET utf8 COLLATE utf8_general_ci;')
-                self.cursor.execute(f'use {get(name, "database")};')
+                self.cursor.execute(f'CREATE DATABASE IF NOT EXISTS {self.quote(get(name, "database"))} CHARACTER SET utf8 COLLATE utf8_general_ci;')
+                self.cursor.execute(f'use {self.quote(get(name, "database"))};')
+                # so a node waits its turn for locked rows instead of failing right away
+                self.cursor.execute(f'set session innodb_lock_wait_timeout = {self.busyTimeout};')
+
+                self.cursor.execute('select @@max_allowed_packet as size;')
+                packetSize = int(get(self.cursor.fetchone(), 'size') or 0)
+
+                if packetSize:
+                    self.maximumStatementBytes = min(self.maximumStatementBytes, packetSize // 2)
 
         except Exception as e:
             self.handleException(e)
@@ -203,22 +742,76 @@ class Database:
         helpers.handleException(e, 'Database error')
 
     def escape(self, string):
+        if self.type == 'mysql':
+            string = string.replace('\\', '\\\\')
+
         return string.replace("'", "''")
 
+    # for table and column names like "option" and "key", which are reserved words in mysql. sqlite accepts the same quotes.
+    def quote(self, name):
+        if '.' in name or name.startswith('`'):
+            return name
+
+        return f'`{name}`'
+
     def close(self):
         if self.connection:
+            self.flush()
             self.connection.commit()
             self.cursor.close()
             self.connection.close()
+            self.connection = None
+
+        with self.lock:
+            for connection in self.readConnections.values():
+                connection.close()
+
+            self.readConnections = {}
+            self.useReadConnections = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exceptionType, exception, traceback):
+        self.close()
 
     def __init__(self, name=None, type='sqlite'):
         self.type = type
+        self.name = name
+        # the writer's connection. also used for reads with mysql.
         self.connection = None
         self.cursor = None
+        # one writer at a time, so statements and their results must not interleave
+        self.lock = threading.RLock()
+        self.transactionThread = None
+
+        # sqlite connections for reading, one per thread
+        self.useReadConnections = False
+        # thread: connection
+        self.readConnections = {}
+        self.threadData = threading.local()
+
+        # for write-behind mode. off until setWriteBehind() is called.
+        self.pendingInserts = []
+        # the tables that have rows in pendingInserts
+        self.pendingTables = set()
+        self.maximumPendingItems = 0
+        self.maximumPendingSeconds = 0
+        self.lastFlush = time.time()
+        self.transactionDepth = 0
+
+        # the longest multi-row insert to send to mysql. open() lowers it to fit max_allowed_packet.
+        self.maximumStatementBytes = 4 * 1000 * 1000
+        # statements converted for mysql
+        self.statements = {}
+        self.registeredExitHandler = False
 
         self.stringKeyType = 'text'
+        # seconds
+        self.busyTimeout = 30
 
         if self.type == 'mysql':
-            self.stringKeyType = 'varchar(100)'
+            # the longest that can be indexed with utf8
+            self.stringKeyType = 'varchar(255)'
         
         self.open(name)
\ No newline at end of file
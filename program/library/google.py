@@ -1,6 +1,7 @@
 import logging
 import sys
 import math
+import time
 
 # pip packages
 import lxml.html as lh
@@ -22,15 +23,94 @@ else:
 
 class Google:
     def search(self, query, numberOfResults=10, acceptAll=True, moreParameters={}, start=0):
-        results = []
+        search = self.startSearch(self.api, query, numberOfResults, acceptAll, moreParameters, start)
 
-        self.captcha = False
-        
-        self.api.urlPrefix = self.defaultSearchUrl
+        cachedResults = self.getCachedResults(search)
+
+        if cachedResults is not None:
+            return cachedResults
 
         if self.internet:
             self.api.proxies = self.internet.getRandomProxy()
 
+        for pageIndex in search['pageIndexes']:
+            pageResults = self.getSearchPage(self.api, search, pageIndex)
+
+            if self.addPageResults(self.api, search, pageResults):
+                break
+
+        self.cacheResults(search)
+
+        return search['results']
+
+    def getSearchPage(self, api, search, pageIndex):
+        parameters = self.getPageParameters(search, pageIndex)
+
+        results = []
+
+        for i in range(0, self.maximumTries):
+            self.captcha = False
+
+            started = time.perf_counter()
+
+            page = api.get('/search', parameters, False)
+
+            results = self.handleSearchPage(api, search, page, started)
+
+            if not self.shouldRetry(api, i):
+                break
+
+        return results
+
+    # same as search(), but the requests and the cache don't block the event loop
+    async def searchAsync(self, query, numberOfResults=10, acceptAll=True, moreParameters={}, start=0):
+        api = self.getAsyncApi()
+
+        search = self.startSearch(api, query, numberOfResults, acceptAll, moreParameters, start)
+
+        cachedResults = await helpers.runInThread(self.getCachedResults, search)
+
+        if cachedResults is not None:
+            return cachedResults
+
+        if self.internet:
+            api.proxies = self.internet.getRandomProxy()
+
+        for pageIndex in search['pageIndexes']:
+            pageResults = await self.getSearchPageAsync(api, search, pageIndex)
+
+            if self.addPageResults(api, search, pageResults):
+                break
+
+        await helpers.runInThread(self.cacheResults, search)
+
+        return search['results']
+
+    async def getSearchPageAsync(self, api, search, pageIndex):
+        parameters = self.getPageParameters(search, pageIndex)
+
+        results = []
+
+        for i in range(0, self.maximumTries):
+            self.captcha = False
+
+            started = time.perf_counter()
+
+            page = await api.get('/search', parameters, False)
+
+            results = self.handleSearchPage(api, search, page, started)
+
+            if not self.shouldRetry(api, i):
+                break
+
+        return results
+
+    # the state of one search. everything except fetching the pages is the same for search() and searchAsync().
+    def startSearch(self, api, query, numberOfResults, acceptAll, moreParameters, start):
+        self.captcha = False
+
+        api.urlPrefix = self.defaultSearchUrl
+
         parameters = {
             'q': query,
             'hl': 'en'
@@ -38,45 +118,116 @@ class Google:
 
         parameters = helpers.mergeDictionaries(parameters, moreParameters)
 
+        cacheParameters = {
+            'url': self.defaultSearchUrl,
+            'numberOfResults': numberOfResults,
+            'acceptAll': acceptAll,
+            'moreParameters': moreParameters,
+            'start': start
+        }
+
         self.resultsPerPage = 10
         pages = numberOfResults / self.resultsPerPage
         startPageIndex = math.ceil(start / self.resultsPerPage)
         endPageIndex = startPageIndex + math.ceil(pages)
-        
-        for pageIndex in range(startPageIndex, endPageIndex):
-            pageResults = self.getSearchPage(query, parameters, numberOfResults, acceptAll, pageIndex)
 
-            if pageResults and numberOfResults == 1:
-                return pageResults
+        return {
+            'query': query,
+            'numberOfResults': numberOfResults,
+            'acceptAll': acceptAll,
+            'parameters': parameters,
+            'cacheParameters': cacheParameters,
+            'pageIndexes': range(startPageIndex, endPageIndex),
+            'results': [],
+            # don't cache error pages
+            'canCache': True
+        }
 
-            if acceptAll and not self.captcha:
-                if not pageResults or pageResults[0] == 'no results' or pageResults == 'no results':
-                    break
+    def getCachedResults(self, search):
+        if not self.serpCache:
+            return None
 
-            results += (pageResults)
+        return self.serpCache.get(search['query'], search['cacheParameters'])
 
-        return results
+    def cacheResults(self, search):
+        if search['canCache'] and self.serpCache:
+            self.serpCache.set(search['query'], search['cacheParameters'], search['results'])
+
+    def getPageParameters(self, search, pageIndex):
+        parameters = search['parameters']
 
-    def getSearchPage(self, query, parameters, numberOfResults, acceptAll, pageIndex):
         if pageIndex > 0:
             parameters['start'] = pageIndex * self.resultsPerPage
 
-        page = self.api.get('/search', parameters, False)
+        return parameters
 
+    def handleSearchPage(self, api, search, page, started):
         if '--debug' in sys.argv:
             helpers.toFile(page, 'user-data/logs/page.html')
 
-        results = []
+        results = self.getSearchResults(page, search['query'], search['numberOfResults'], search['acceptAll'])
 
-        for i in range(0, self.maximumTries):
-            results = self.getSearchResults(page, query, numberOfResults, acceptAll)
+        self.reportProxyResult(api, started)
+
+        return results
 
-            if self.captcha:
-                self.log.debug(f'Captcha detected. Try {i + 1} of {self.maximumTries}.')
+    # returns true when there's no need to get more pages
+    def addPageResults(self, api, search, pageResults):
+        if self.captcha or api.error or api.lastStatusCodeIsError():
+            search['canCache'] = False
+
+        if pageResults and search['numberOfResults'] == 1:
+            search['results'] = pageResults
+            return True
+
+        if search['acceptAll'] and not self.captcha:
+            if not pageResults or pageResults[0] == 'no results' or pageResults == 'no results':
+                return True
+
+        search['results'] += (pageResults)
+
+        return False
+
+    # a captcha'd proxy would get the same captcha again, so only retries with a different one
+    def shouldRetry(self, api, i):
+        if not self.captcha or not self.retryOnCaptcha or not self.internet:
+            return False
+
+        if i + 1 >= self.maximumTries:
+            return False
+
+        proxies = self.internet.getRandomProxy()
+
+        if not proxies or proxies == api.proxies:
+            return False
+
+        api.proxies = proxies
+
+        self.log.debug(f'Captcha detected. Trying again with another proxy. Try {i + 2} of {self.maximumTries}.')
+
+        return True
+
+    # lets the proxy pool know how well the proxy worked
+    def reportProxyResult(self, api, started):
+        if not self.internet or not api.proxies:
+            return
+
+        self.internet.reportResult(api.proxies, time.perf_counter() - started, api.error or api.lastStatusCodeIsError(), self.captcha)
+
+    def getAsyncApi(self):
+        if not self.asyncApi:
+            if '--debug' in sys.argv:
+                from async_api import AsyncApi
             else:
-                break
+                from .async_api import AsyncApi
 
-        return results
+            self.asyncApi = AsyncApi('', self.options)
+            self.asyncApi.setHeadersFromHarFile('program/resources/headers.txt', '')
+            self.asyncApi.rateLimiter = self.api.rateLimiter
+            self.asyncApi.retryPolicy = self.api.retryPolicy
+            self.asyncApi.retryOnErrorStatus = self.api.retryOnErrorStatus
+
+        return self.asyncApi
 
     def getSearchResults(self, page, query, numberOfResults, acceptAll):
         result = ''
@@ -183,7 +334,12 @@ class Google:
         return result
 
     def __init__(self, options):
+        self.options = options
         self.api = Api('', options)
+        # a 429 from google is a captcha. that's handled by trying another proxy.
+        self.api.retryOnErrorStatus = False
+        # only made if searchAsync is used
+        self.asyncApi = None
         self.website = Website(options)
         self.captcha = False
         self.avoidDomains = []
@@ -192,7 +348,10 @@ class Google:
         self.log = logging.getLogger(get(options, 'loggerName'))
         self.internet = Internet(options)
         self.retryOnCaptcha = True
-        self.maximumTries = 30
+        # fetches with a new proxy each time
+        self.maximumTries = 3
+        # optional. stores results of recent searches.
+        self.serpCache = None
 
         self.api.setHeadersFromHarFile('program/resources/headers.txt', '')
 
@@ -5,6 +5,8 @@ import datetime
 import time
 import logging
 import traceback
+import asyncio
+import functools
 
 def get(item, key):
     if not item:
@@ -360,38 +362,57 @@ def stringToFloatingPoint(s):
 
 
 def getCsvFile(fileName, asDictionary=True, delimiter=','):
-    result = []
+    return list(iterateCsvFile(fileName, asDictionary, delimiter))
+
 
+# yields the rows one at a time, so the file can be bigger than the available memory
+def iterateCsvFile(fileName, asDictionary=True, delimiter=','):
     if not os.path.exists(fileName):
-        return result
+        return
 
     import csv
 
-    encodings = ['utf8', 'latin-1']
+    encoding = detectEncoding(fileName)
 
-    for encoding in encodings:
-        try:
-            with open(fileName, encoding=encoding) as inputFile:
-                if asDictionary:
-                    csvReader = csv.DictReader(inputFile, delimiter=delimiter)
-                else:
-                    csvReader = csv.reader(inputFile, delimiter=delimiter)
-                    # skip the headers
-                    next(csvReader, None)
+    # the encoding is decided from the start of the file. a bad character later on doesn't mean starting over.
+    with open(fileName, encoding=encoding, errors='replace', newline='') as inputFile:
+        csvReader = csv.reader(inputFile, delimiter=delimiter)
 
-                for row in csvReader:
-                    if len(row) == 0:
-                        continue
+        headers = next(csvReader, None)
 
-                    result.append(row)
+        if headers is None:
+            return
 
-                return result
-        except Exception as e:
-            # start again
-            result = []
-            logging.debug(e)
+        for row in csvReader:
+            if len(row) == 0:
+                continue
 
-    return result
+            if asDictionary:
+                # like csv.DictReader but without its extra key for extra fields
+                row = dict(zip(headers, row + [''] * (len(headers) - len(row))))
+
+            yield row
+
+
+# checks a sample from the start of the file instead of reading all of it
+def detectEncoding(fileName, sampleBytes=1000 * 1000):
+    import codecs
+
+    with open(fileName, 'rb') as file:
+        sample = file.read(sampleBytes)
+
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+
+    try:
+        # the sample can end in the middle of a character
+        codecs.getincrementaldecoder('utf8')().decode(sample, final=False)
+
+        return 'utf8'
+    except UnicodeDecodeError as e:
+        logging.debug(f'{fileName} is not utf8. Using latin-1. {e}')
+
+    return 'latin-1'
 
 
 def appendCsvFile(row, fileName):
@@ -902,4 +923,18 @@ def backup(fileName, directory, numberOfCopies, zip=True, loggerName=None):
 
         removeFilesExceptNewest(directory, numberOfCopies, loggerName)
     except Exception as e:
-        handleException(e, f'Something went wrong while trying to backup {fileName}', loggerName)
\ No newline at end of file
+        handleException(e, f'Something went wrong while trying to backup {fileName}', loggerName)
+
+
+# runs blocking work like database queries or file access without stopping the event loop
+async def runInThread(function, *arguments):
+    loop = asyncio.get_running_loop()
+
+    return await loop.run_in_executor(None, functools.partial(function, *arguments))
+
+# worker "index" of "count" gets this part of a whole number limit. the lowest indexes get the remainder,
+# so the parts add up to the limit.
+def getShare(limit, count, index):
+    limit = int(limit)
+
+    return limit // count + (1 if index < limit % count else 0)
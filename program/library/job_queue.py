@@ -0,0 +1,292 @@
+import os
+import sys
+import json
+import uuid
+import socket
+import logging
+import threading
+import contextlib
+
+from datetime import datetime, timedelta
+
+if '--debug' in sys.argv:
+    import helpers as helpers
+
+    from helpers import get
+else:
+    from . import helpers
+
+    from .helpers import get
+
+class JobQueue:
+    # keeps the input rows in the job table with their status, so a run that stops part way
+    # can continue where it was instead of reading and checking every row again.
+    # statuses: pending, in-progress, done, failed.
+    # a claimed job has a lease. the heartbeat renews it while the job is being checked. if the process or
+    # machine dies, the lease runs out and another one claims the job again.
+
+    # loads the rows unless the same input is already in the table and not finished. returns the number of jobs.
+    def start(self, getRows, signature):
+        self.flush()
+
+        with self.lockJobs():
+            row = self.database.getFirst('option', 'value', "name = 'jobInputSignature'")
+            counts = self.getCounts()
+
+            unfinished = counts['pending'] + counts['in-progress']
+
+            # other machines can be working on the same jobs. they might have a different copy of the input file.
+            if self.shared and unfinished:
+                self.join(counts)
+            elif get(row, 'value') == signature and unfinished:
+                self.resume(counts)
+            else:
+                self.load(getRows(), signature)
+
+        return self.getTotal()
+
+    def resume(self, counts):
+        self.log.info(f'Continuing the previous run. {counts["done"]} of {sum(counts.values())} domains are done.')
+
+        # whatever was being checked when it stopped
+        self.database.execute(f"update job set status = 'pending', claimToken = '', leaseExpires = '', owner = '' where status = 'in-progress'")
+
+    # the jobs that are in progress belong to other machines. claim() takes them when their leases run out.
+    def join(self, counts):
+        self.log.info(f'Joining the run that\'s in progress. {counts["done"]} of {sum(counts.values())} domains are done.')
+
+    # so two machines don't load the input at the same time
+    @contextlib.contextmanager
+    def lockJobs(self):
+        if not self.shared:
+            yield
+            return
+
+        row = self.database.execute(f"select get_lock('{self.lockName}', {self.leaseSeconds}) as locked", True)
+
+        if not row or str(get(row[0], 'locked')) != '1':
+            raise Exception('Could not lock the job table. Another machine might be loading the input.')
+
+        try:
+            yield
+        finally:
+            self.database.execute(f"select release_lock('{self.lockName}') as released", True)
+
+    # the rows can be a generator. only one batch of them is in memory at a time.
+    def load(self, rows, signature):
+        self.log.info('Loading the input into the job table')
+
+        now = self.now()
+        count = 0
+        newRows = []
+
+        with self.database.transaction():
+            self.database.execute('delete from job')
+
+            for i, inputRow in enumerate(rows):
+                url = get(inputRow, 'Ds Company Website')
+
+                newRow = {
+                    'id': i + 1,
+                    'url': url,
+                    'inputRow': json.dumps(inputRow),
+                    'status': 'pending',
+                    'attempts': 0,
+                    'claimToken': '',
+                    'leaseExpires': '',
+                    'owner': '',
+                    'domainHash': self.getDomainHash(url),
+                    'error': '',
+                    'gmDateCreated': now,
+                    'gmDateUpdated': now
+                }
+
+                newRows.append(newRow)
+
+                count += 1
+
+                if len(newRows) >= self.rowsPerInsert:
+                    self.database.insert('job', newRows)
+                    newRows = []
+
+                if count % 100000 == 0:
+                    self.log.info(f'Loaded {count} jobs so far')
+
+            self.database.insert('job', newRows)
+
+            newRow = {
+                'name': 'jobInputSignature',
+                'value': signature
+            }
+
+            self.database.insert('option', newRow)
+
+        self.log.info(f'Loaded {count} jobs')
+
+    # marks up to "count" pending jobs, or jobs whose lease ran out, as in progress and returns them as (job id, input row).
+    # the input row gets a "job" item with the job id and claim token to give to markDone() and markFailed().
+    def claim(self, count):
+        results = []
+        rows = []
+
+        # another machine can take the same jobs between the select and the update. then try again.
+        for i in range(0, self.maximumClaimTries):
+            token = uuid.uuid4().hex
+            now = self.now()
+            condition = f"(status = 'pending' or (status = 'in-progress' and leaseExpires < ?)){self.getShardCondition()}"
+
+            with self.database.transaction():
+                rows = self.database.get('job', 'id', condition, 'id', 'asc', count, params=(now,))
+
+                if not rows:
+                    return results
+
+                ids = ', '.join([str(get(row, 'id')) for row in rows])
+
+                self.database.execute(f"update job set status = 'in-progress', attempts = attempts + 1, claimToken = ?, leaseExpires = ?, owner = ?, gmDateUpdated = ? where id in ({ids}) and {condition}", params=(token, self.getLeaseExpires(), self.owner, now, now))
+
+                rows = self.database.get('job', 'id, inputRow', 'claimToken = ?', 'id', 'asc', params=(token,))
+
+            if rows:
+                break
+
+        for row in rows:
+            jobId = int(get(row, 'id'))
+            inputRow = json.loads(get(row, 'inputRow'))
+            inputRow['job'] = (jobId, token)
+
+            results.append((jobId, inputRow))
+
+        return results
+
+    def getLeaseExpires(self):
+        return (datetime.utcnow() + timedelta(seconds=self.leaseSeconds)).strftime('%Y-%m-%d %H:%M:%S')
+
+    # renews the leases of this process's jobs until stopHeartbeat() is called
+    def startHeartbeat(self):
+        self.heartbeatStopped.clear()
+
+        self.heartbeatThread = threading.Thread(target=self.heartbeat, name='job-heartbeat', daemon=True)
+        self.heartbeatThread.start()
+
+    def stopHeartbeat(self):
+        self.heartbeatStopped.set()
+
+        if self.heartbeatThread:
+            self.heartbeatThread.join()
+            self.heartbeatThread = None
+
+    def heartbeat(self):
+        while not self.heartbeatStopped.wait(self.heartbeatSeconds):
+            try:
+                self.renewLeases()
+            except Exception as e:
+                helpers.handleException(e, 'Could not renew the job leases')
+
+    def renewLeases(self):
+        self.log.debug('Renewing job leases')
+
+        self.database.execute("update job set leaseExpires = ? where owner = ? and status = 'in-progress'", params=(self.getLeaseExpires(), self.owner))
+
+    # a worker process only gets the domains in its shard
+    def getShardCondition(self):
+        if self.workerCount <= 1:
+            return ''
+
+        return f' and domainHash % {self.workerCount} = {self.workerIndex}'
+
+    def getTotal(self):
+        return sum(self.getCounts().values())
+
+    def markDone(self, jobId, claimToken):
+        self.finish(jobId, claimToken, 'done')
+
+    def markFailed(self, jobId, claimToken, error=''):
+        self.finish(jobId, claimToken, 'failed', error)
+
+    # status changes are written in batches, like results. if the run crashes before that,
+    # the jobs are pending again next time and alreadyDone skips the ones that have results.
+    # only changes the job if it still has the same claim. another machine may have taken it after the lease ran out.
+    def finish(self, jobId, claimToken, status, error=''):
+        with self.lock:
+            self.finished.append((jobId, claimToken, status, error))
+
+            if len(self.finished) < self.batchSize:
+                return
+
+        self.flush()
+
+    def flush(self):
+        with self.lock:
+            finished = self.finished
+            self.finished = []
+
+        if not finished:
+            return
+
+        # so a job is never done without its result
+        self.database.flush()
+
+        now = self.now()
+
+        paramsList = [(status, str(error)[0:1000], now, jobId, claimToken) for jobId, claimToken, status, error in finished]
+
+        with self.database.transaction():
+            self.database.executeMany("update job set status = ?, error = ?, claimToken = '', leaseExpires = '', owner = '', gmDateUpdated = ? where id = ? and claimToken = ? and status = 'in-progress'", paramsList)
+
+    def getCounts(self):
+        result = {
+            'pending': 0,
+            'in-progress': 0,
+            'done': 0,
+            'failed': 0
+        }
+
+        for row in self.database.execute('select status, count(*) as count from job group by status', True) or []:
+            result[get(row, 'status')] = int(get(row, 'count') or 0)
+
+        return result
+
+    # a stable number for the domain, so the same domain always goes to the same shard
+    def getDomainHash(self, url):
+        domain = helpers.getDomainName(url) or url
+
+        return int(helpers.hash(domain.lower())[0:8], 16)
+
+    # changes when the input changes
+    @staticmethod
+    def getSignature(inputFile, urls=''):
+        if urls:
+            return helpers.hash(urls)
+
+        if not os.path.exists(inputFile):
+            return ''
+
+        return helpers.hash(f'{os.path.abspath(inputFile)} {os.path.getsize(inputFile)} {os.path.getmtime(inputFile)}')
+
+    def now(self):
+        return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+    def __init__(self, database, options):
+        self.database = database
+        self.log = logging.getLogger(get(options, 'loggerName'))
+        self.batchSize = int(get(options, 'databaseBatchSize') or 1)
+        self.leaseSeconds = int(get(options, 'jobLeaseSeconds') or 15 * 60)
+        self.workerIndex = int(get(options, 'workerIndex') or 0)
+        self.workerCount = int(get(options, 'workerCount') or 1)
+        # renews the leases well before they run out
+        self.heartbeatSeconds = max(1, self.leaseSeconds / 3)
+        self.maximumClaimTries = 5
+        # how many jobs load() keeps in memory before inserting them
+        self.rowsPerInsert = 500
+
+        # mysql can be used by several machines at once
+        self.shared = database.type == 'mysql'
+        self.lockName = 'keywordFinderJobs'
+        # identifies the jobs this process claimed
+        self.owner = f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[0:8]}'
+
+        self.finished = []
+        self.lock = threading.Lock()
+        self.heartbeatStopped = threading.Event()
+        self.heartbeatThread = None
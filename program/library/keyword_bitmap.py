@@ -0,0 +1,309 @@
+import os
+import sys
+import csv
+import json
+import logging
+import threading
+
+if '--debug' in sys.argv:
+    import helpers as helpers
+
+    from helpers import get
+else:
+    from . import helpers
+
+    from .helpers import get
+
+class KeywordBitmap:
+    # one row of bits per domain and one bit per keyword, in a memory mapped file. a keyword keeps its bit
+    # once it has one, so adding keywords doesn't change the existing rows. 10 million domains with 100
+    # keywords take about 160 MB.
+    # the rows are filled in from the result table by update(). which row belongs to which domain is in the
+    # bitmapRow table.
+
+    # adds the results that are newer than the last update
+    def update(self, resultDatabase):
+        resultId = int(get(self.database.getFirst('option', 'value', "name = 'keywordBitmapResultId'"), 'value') or 0)
+        count = 0
+
+        for row in resultDatabase.iterate('select id, url, inputId, keyword from result where id > ? order by id', params=(resultId,)):
+            keywords = get(row, 'keyword')
+            keywords = keywords.split(';') if keywords else []
+
+            self.set(get(row, 'url'), get(row, 'inputId'), keywords)
+
+            resultId = int(get(row, 'id'))
+            count += 1
+
+        if not count:
+            return
+
+        self.flush()
+
+        newRow = {
+            'name': 'keywordBitmapResultId',
+            'value': str(resultId)
+        }
+
+        self.database.insert('option', newRow)
+
+        self.log.debug(f'Added {count} results to the keyword bitmap')
+
+    # replaces the keywords of the domain
+    def set(self, url, inputId, keywords):
+        with self.lock:
+            indexes = [self.getKeywordIndex(keyword) for keyword in keywords if keyword]
+
+            row = self.getRow(url, inputId)
+
+            values = bytearray(self.bytesPerRow)
+
+            for index in indexes:
+                values[index >> 3] |= 1 << (index & 7)
+
+            self.bits[row] = self.numpy.frombuffer(bytes(values), dtype=self.numpy.uint8)
+
+    def getRow(self, url, inputId):
+        row = self.database.find('bitmapRow', 'rowNumber', {'url': url})
+
+        if row:
+            return int(get(row, 'rowNumber'))
+
+        result = self.rowCount
+        self.rowCount += 1
+
+        if result >= self.capacity:
+            self.resize(max(self.capacity * 2, 1024), self.bytesPerRow)
+
+        newRow = {
+            'url': url,
+            'rowNumber': result,
+            'inputId': inputId
+        }
+
+        self.database.insert('bitmapRow', newRow)
+
+        return result
+
+    def getKeywordIndex(self, keyword):
+        result = self.keywordIndexes.get(keyword)
+
+        if result is not None:
+            return result
+
+        result = len(self.keywords)
+
+        # the rows need to be wider
+        if result >= self.bytesPerRow * 8:
+            self.resize(self.capacity, self.bytesPerRow * 2)
+
+        self.keywords.append(keyword)
+        self.keywordIndexes[keyword] = result
+
+        self.saveInformation()
+
+        return result
+
+    # number of domains that have each keyword
+    def getCounts(self, keywords=None):
+        keywords = self.getKnownKeywords(keywords)
+        indexes = self.getIndexes(keywords)
+        counts = self.numpy.zeros(len(indexes), dtype=self.numpy.int64)
+
+        for chunk in self.getChunks():
+            counts += self.unpack(chunk, indexes).sum(axis=0, dtype=self.numpy.int64)
+
+        return dict(zip(keywords, counts.tolist()))
+
+    # how many domains have both keywords, for each pair. the diagonal is the count for each keyword.
+    def getCooccurrence(self, keywords=None):
+        keywords = self.getKnownKeywords(keywords)
+        indexes = self.getIndexes(keywords)
+        result = self.numpy.zeros((len(indexes), len(indexes)), dtype=self.numpy.int64)
+
+        # smaller chunks because the matrix product needs more memory per row
+        for chunk in self.getChunks(self.chunkRows // 10):
+            matrix = self.unpack(chunk, indexes).astype(self.numpy.int32)
+            result += matrix.T @ matrix
+
+        return keywords, result
+
+    # the rows of domains that have all of "allKeywords", at least one of "anyKeywords" and none of "noKeywords"
+    def filter(self, allKeywords=[], anyKeywords=[], noKeywords=[]):
+        result = self.numpy.ones(self.rowCount, dtype=bool)
+
+        for keyword in allKeywords:
+            result &= self.getMask(keyword)
+
+        if anyKeywords:
+            anyMask = self.numpy.zeros(self.rowCount, dtype=bool)
+
+            for keyword in anyKeywords:
+                anyMask |= self.getMask(keyword)
+
+            result &= anyMask
+
+        for keyword in noKeywords:
+            result &= ~self.getMask(keyword)
+
+        return self.numpy.flatnonzero(result)
+
+    # true for each row that has the keyword
+    def getMask(self, keyword):
+        index = self.keywordIndexes.get(keyword)
+
+        if index is None:
+            return self.numpy.zeros(self.rowCount, dtype=bool)
+
+        column = self.bits[0:self.rowCount, index >> 3]
+
+        return (column & (1 << (index & 7))) != 0
+
+    # (row, url, input id) for the rows
+    def getDomains(self, rows):
+        for i in range(0, len(rows), 500):
+            yield from self.getDomainBatch(rows[i:i + 500])
+
+    def getDomainBatch(self, rows):
+        rowList = ', '.join([str(int(row)) for row in rows])
+
+        for item in self.database.get('bitmapRow', 'rowNumber, url, inputId', f'rowNumber in ({rowList})', 'rowNumber', 'asc'):
+            yield int(get(item, 'rowNumber')), get(item, 'url'), get(item, 'inputId')
+
+    # in the same layout as the output file. only the domains that match, if any keywords are given.
+    def export(self, fileName, keywords=None, allKeywords=[], anyKeywords=[], noKeywords=[]):
+        keywords = self.getKnownKeywords(keywords)
+        indexes = self.getIndexes(keywords)
+
+        if allKeywords or anyKeywords or noKeywords:
+            rows = self.filter(allKeywords, anyKeywords, noKeywords)
+        else:
+            rows = self.numpy.arange(self.rowCount)
+
+        helpers.makeDirectory(os.path.dirname(fileName))
+
+        with open(fileName, 'w', encoding='utf-8', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['Ds Id', 'Ds Company Website'] + keywords)
+
+            for i in range(0, len(rows), 500):
+                batch = rows[i:i + 500]
+                matrix = self.unpack(self.bits[batch], indexes)
+                positions = {int(row): j for j, row in enumerate(batch)}
+
+                for row, url, inputId in self.getDomainBatch(batch):
+                    bits = matrix[positions[row]]
+
+                    writer.writerow([inputId, url] + [keyword if bit else '' for keyword, bit in zip(keywords, bits)])
+
+        self.log.info(f'Wrote {len(rows)} domains to {fileName}')
+
+    # one column of 0 or 1 for each keyword
+    def unpack(self, chunk, indexes):
+        return self.numpy.unpackbits(chunk, axis=1, bitorder='little')[:, indexes]
+
+    def getChunks(self, chunkRows=None):
+        chunkRows = chunkRows or self.chunkRows
+
+        for start in range(0, self.rowCount, chunkRows):
+            yield self.bits[start:min(start + chunkRows, self.rowCount)]
+
+    # all of them by default. keywords that were never found have no bit.
+    def getKnownKeywords(self, keywords=None):
+        return [keyword for keyword in (keywords or self.keywords) if keyword in self.keywordIndexes]
+
+    def getIndexes(self, keywords):
+        return [self.keywordIndexes[keyword] for keyword in keywords]
+
+    # changes the number of rows or the bytes per row
+    def resize(self, capacity, bytesPerRow):
+        self.log.debug(f'Resizing the keyword bitmap to {capacity} rows of {bytesPerRow} bytes')
+
+        if bytesPerRow == self.bytesPerRow:
+            self.bits.flush()
+            self.bits = None
+
+            with open(self.fileName, 'r+b') as file:
+                file.truncate(capacity * bytesPerRow)
+        else:
+            # the existing bits stay in the same place in each row
+            temporaryFileName = f'{self.fileName}.tmp'
+
+            newBits = self.numpy.memmap(temporaryFileName, dtype=self.numpy.uint8, mode='w+', shape=(capacity, bytesPerRow))
+
+            for start in range(0, self.rowCount, self.chunkRows):
+                end = min(start + self.chunkRows, self.rowCount)
+                newBits[start:end, 0:self.bytesPerRow] = self.bits[start:end]
+
+            newBits.flush()
+
+            newBits = None
+            self.bits = None
+
+            os.replace(temporaryFileName, self.fileName)
+
+        self.capacity = capacity
+        self.bytesPerRow = bytesPerRow
+        self.bits = self.numpy.memmap(self.fileName, dtype=self.numpy.uint8, mode='r+', shape=(self.capacity, self.bytesPerRow))
+
+        self.saveInformation()
+
+    def flush(self):
+        with self.lock:
+            self.bits.flush()
+
+        self.database.flush()
+
+    def saveInformation(self):
+        information = {
+            'keywords': self.keywords,
+            'bytesPerRow': self.bytesPerRow,
+            'capacity': self.capacity
+        }
+
+        helpers.toFile(json.dumps(information), self.informationFileName)
+
+    def open(self):
+        helpers.makeDirectory(self.directory)
+
+        information = {}
+
+        if os.path.exists(self.fileName) and os.path.exists(self.informationFileName):
+            information = helpers.getJsonFile(self.informationFileName)
+
+        if not information:
+            # a new file. the rows are made again from the result table.
+            self.database.execute('delete from bitmapRow')
+            self.database.execute("delete from `option` where name = 'keywordBitmapResultId'")
+
+        self.keywords = get(information, 'keywords') or []
+        self.keywordIndexes = {keyword: i for i, keyword in enumerate(self.keywords)}
+        # room for 64 keywords to start with
+        self.bytesPerRow = int(get(information, 'bytesPerRow') or 8)
+        self.capacity = int(get(information, 'capacity') or 1024)
+
+        if not information:
+            with open(self.fileName, 'wb') as file:
+                file.truncate(self.capacity * self.bytesPerRow)
+
+            self.saveInformation()
+
+        self.bits = self.numpy.memmap(self.fileName, dtype=self.numpy.uint8, mode='r+', shape=(self.capacity, self.bytesPerRow))
+
+        row = self.database.getFirst('bitmapRow', 'max(rowNumber) as rowNumber', None)
+        self.rowCount = int(get(row, 'rowNumber')) + 1 if get(row, 'rowNumber') != '' else 0
+
+    def __init__(self, database, options):
+        # optional dependency. only needed if the bitmap is used.
+        import numpy
+
+        self.numpy = numpy
+        self.database = database
+        self.log = logging.getLogger(get(options, 'loggerName'))
+        self.directory = get(options, 'keywordBitmapDirectory') or 'user-data/bitmap'
+        self.fileName = os.path.join(self.directory, 'bits.dat')
+        self.informationFileName = os.path.join(self.directory, 'information.json')
+        self.chunkRows = 1000 * 1000
+        self.lock = threading.RLock()
+
+        self.open()
@@ -0,0 +1,258 @@
+import re
+
+from collections import deque
+
+# for each character, every character that starts with it when lowercased
+reverseLowercase = None
+
+def getReverseLowercase():
+    global reverseLowercase
+
+    if reverseLowercase is None:
+        result = {}
+
+        for number in range(0, 0x110000):
+            character = chr(number)
+            lowercase = character.lower()
+
+            if lowercase != character:
+                result.setdefault(lowercase[0], []).append(character)
+
+        reverseLowercase = result
+
+    return reverseLowercase
+
+class Automaton:
+    # aho-corasick automaton. finds every pattern in one pass over the text.
+    def step(self, state, character):
+        transitions = self.transitions
+
+        while True:
+            nextState = transitions[state].get(character)
+
+            if nextState is not None:
+                return nextState
+
+            if state == 0:
+                return 0
+
+            state = self.failures[state]
+
+    # returns the next state for a character of the original text. remembers the answer, so walking
+    # the failure links only happens the first time a state sees a character.
+    def getNextState(self, state, character):
+        if self.lowercase:
+            lowercase = character.lower()
+
+            # the result depends on states in between, so it can't be remembered as one step
+            if len(lowercase) > 1:
+                return -1
+
+            character, original = lowercase, character
+        else:
+            original = character
+
+        nextState = self.step(state, character)
+
+        self.cache[state][original] = nextState
+
+        return nextState
+
+    def build(self, patterns):
+        for index, pattern in enumerate(patterns):
+            state = 0
+
+            for character in pattern:
+                nextState = self.transitions[state].get(character)
+
+                if nextState is None:
+                    nextState = len(self.transitions)
+                    self.transitions.append({})
+                    self.failures.append(0)
+                    self.outputs.append(())
+                    self.transitions[state][character] = nextState
+
+                state = nextState
+
+            self.outputs[state] = self.outputs[state] + (index,)
+
+        # breadth first so the failure state of a parent is always ready before its children
+        queue = deque(self.transitions[0].values())
+
+        while queue:
+            state = queue.popleft()
+
+            for character, nextState in self.transitions[state].items():
+                queue.append(nextState)
+
+                failure = self.step(self.failures[state], character)
+
+                if failure == nextState:
+                    failure = 0
+
+                self.failures[nextState] = failure
+                self.outputs[nextState] = self.outputs[nextState] + self.outputs[failure]
+
+        self.cache = [{} for transitions in self.transitions]
+
+    def getFirstCharacters(self):
+        result = set(self.transitions[0].keys())
+
+        if self.lowercase:
+            for character in list(result):
+                result.update(getReverseLowercase().get(character, []))
+
+        return result
+
+    def __init__(self, patterns, lowercase=False):
+        # if true, the text is matched as if it was lowercase
+        self.lowercase = lowercase
+
+        self.transitions = [{}]
+        self.failures = [0]
+        self.outputs = [()]
+
+        self.build(patterns)
+
+class KeywordScanner:
+    # keeps the position in the automatons, so text can be fed in pieces
+    # and matches that span two pieces are still found
+    def feed(self, text):
+        if not text or self.foundAll():
+            return
+
+        matcher = self.matcher
+        found = self.found
+        insensitiveState = self.insensitiveState
+        sensitiveState = self.sensitiveState
+
+        insensitive = matcher.insensitive
+        sensitive = matcher.sensitive
+        insensitiveCache = insensitive.cache if insensitive else None
+        sensitiveCache = sensitive.cache if sensitive else None
+        insensitiveOutputs = matcher.insensitiveOutputs
+        sensitiveOutputs = matcher.sensitiveOutputs
+        findStart = matcher.firstCharacters.search
+
+        position = 0
+        length = len(text)
+
+        while position < length:
+            # nothing started yet. skip to the next character that can start a keyword.
+            if not insensitiveState and not sensitiveState:
+                match = findStart(text, position)
+
+                if not match:
+                    break
+
+                position = match.start()
+
+            character = text[position]
+            position += 1
+
+            if insensitive:
+                nextState = insensitiveCache[insensitiveState].get(character)
+
+                if nextState is None:
+                    nextState = insensitive.getNextState(insensitiveState, character)
+
+                if nextState < 0:
+                    for part in character.lower():
+                        insensitiveState = insensitive.step(insensitiveState, part)
+                        found.update(insensitiveOutputs.get(insensitiveState, ()))
+                else:
+                    insensitiveState = nextState
+
+                    if insensitiveState in insensitiveOutputs:
+                        found.update(insensitiveOutputs[insensitiveState])
+
+            if sensitive:
+                nextState = sensitiveCache[sensitiveState].get(character)
+
+                if nextState is None:
+                    nextState = sensitive.getNextState(sensitiveState, character)
+
+                sensitiveState = nextState
+
+                if sensitiveState in sensitiveOutputs:
+                    found.update(sensitiveOutputs[sensitiveState])
+
+        self.insensitiveState = insensitiveState
+        self.sensitiveState = sensitiveState
+
+    def foundAll(self):
+        return len(self.found) >= self.matcher.patternCount
+
+    def getMatchingKeywords(self):
+        result = []
+
+        for keyword in self.matcher.keywords:
+            if ('', keyword.lower()) in self.found or not keyword:
+                result.append(keyword)
+
+        for keyword in self.matcher.keywordsCaseSensitive:
+            if ('sensitive', keyword) in self.found or not keyword:
+                result.append(keyword)
+
+        return result
+
+    def __init__(self, matcher):
+        self.matcher = matcher
+        self.insensitiveState = 0
+        self.sensitiveState = 0
+        self.found = set()
+
+class KeywordMatcher:
+    # same result as checking "keyword.lower() in page.lower()" for each keyword and "keyword in page"
+    # for each case sensitive keyword, but looks at each character of the page only once
+    def getMatchingKeywords(self, text):
+        scanner = self.getScanner()
+        scanner.feed(text)
+
+        return scanner.getMatchingKeywords()
+
+    def getScanner(self):
+        return KeywordScanner(self)
+
+    def getOutputs(self, automaton, patterns):
+        result = {}
+
+        if not automaton:
+            return result
+
+        for state, indexes in enumerate(automaton.outputs):
+            if indexes:
+                result[state] = [patterns[index] for index in indexes]
+
+        return result
+
+    def __init__(self, keywords, keywordsCaseSensitive):
+        self.keywords = keywords
+        self.keywordsCaseSensitive = keywordsCaseSensitive
+
+        # an empty keyword is in every page, so it doesn't need to be searched for
+        self.insensitivePatterns = sorted(set([('', keyword.lower()) for keyword in keywords if keyword]))
+        self.sensitivePatterns = sorted(set([('sensitive', keyword) for keyword in keywordsCaseSensitive if keyword]))
+
+        self.patternCount = len(self.insensitivePatterns) + len(self.sensitivePatterns)
+
+        self.insensitive = None
+        self.sensitive = None
+
+        firstCharacters = set()
+
+        if self.insensitivePatterns:
+            self.insensitive = Automaton([pattern[1] for pattern in self.insensitivePatterns], True)
+            firstCharacters.update(self.insensitive.getFirstCharacters())
+
+        if self.sensitivePatterns:
+            self.sensitive = Automaton([pattern[1] for pattern in self.sensitivePatterns])
+            firstCharacters.update(self.sensitive.getFirstCharacters())
+
+        # the states where keywords end and the keywords that end there
+        self.insensitiveOutputs = self.getOutputs(self.insensitive, self.insensitivePatterns)
+        self.sensitiveOutputs = self.getOutputs(self.sensitive, self.sensitivePatterns)
+
+        # matches nothing if there are no keywords
+        characterClass = ''.join([re.escape(character) for character in sorted(firstCharacters)])
+        self.firstCharacters = re.compile(f'[{characterClass}]' if characterClass else '(?!)')
@@ -5,6 +5,8 @@ import json
 import random
 import re
 import datetime
+import threading
+import contextlib
 
 from collections import OrderedDict
 
@@ -994,21 +996,35 @@ class Internet:
 
         return result
 
-    def getRandomProxy(self):
-        if not self.proxies:
-            if os.path.exists('user-data/proxies.csv'):
-                self.proxies = helpers.getCsvFile('user-data/proxies.csv')
-            elif self.proxyListUrl:            
-                self.proxies = self.getProxiesFromApi()
-
+    def getProxies(self):
+        # several searches can share this object
+        with self.lock:
             if not self.proxies:
-                self.log.info('No proxies found')
+                if os.path.exists('user-data/proxies.csv'):
+                    self.proxies = helpers.getCsvFile('user-data/proxies.csv')
+                elif self.proxyListUrl:            
+                    self.proxies = self.getProxiesFromApi()
+
+                if not self.proxies:
+                    self.log.info('No proxies found')
+
+                # each worker process gets its own part of the list
+                if self.proxies and self.workerCount > 1 and len(self.proxies) >= self.workerCount:
+                    self.proxies = self.proxies[self.workerIndex::self.workerCount]
+                    self.splitProxies = True
+
+        return self.proxies
+
+    def getRandomProxy(self):
+        if self.proxyPool:
+            return self.proxyPool.getProxy()
 
-        if not self.proxies:
+        if not self.getProxies():
             return None
 
-        item = random.choice(self.proxies)
+        return self.toProxyDictionary(random.choice(self.proxies))
 
+    def toProxyDictionary(self, item, log=True):
         if isinstance(item, dict):
             url = item.get('url', '')
             port = item.get('port', '')
@@ -1020,11 +1036,14 @@ class Internet:
             if not userName or not password:
                 proxy = f'http://{url}:{port}'
 
-            self.log.debug(f'Using proxy http://{url}:{port}')
+            if log:
+                self.log.debug(f'Using proxy http://{url}:{port}')
         # plain string
         else:
             proxy = item
-            self.log.debug('Using proxy ' + helpers.findBetween(proxy, '@', ''))
+
+            if log:
+                self.log.debug('Using proxy ' + helpers.findBetween(proxy, '@', ''))
 
         proxies = {
             'http': proxy,
@@ -1033,6 +1052,11 @@ class Internet:
 
         return proxies
 
+    # tells the proxy pool how a request went, if there is one
+    def reportResult(self, proxies, seconds, error=False, captcha=False):
+        if self.proxyPool:
+            self.proxyPool.report(proxies, seconds, error, captcha)
+
     def __init__(self, options):
         self.options = options
         self.log = logging.getLogger(get(options, 'loggerName'))
@@ -1040,6 +1064,13 @@ class Internet:
         self.proxyProvider = get(self.options, 'proxyProvider')
         self.proxies = None
         self.proxyListUrl = get(self.options, 'proxyListUrl')
+        self.lock = threading.Lock()
+        # optional. a ProxyPool that chooses proxies by how well they worked.
+        self.proxyPool = None
+        self.workerIndex = int(get(self.options, 'workerIndex') or 0)
+        self.workerCount = int(get(self.options, 'workerCount') or 1)
+        # true if the other worker processes use different proxies
+        self.splitProxies = False
 
 class LocationHelper:
     # a box centered at given coordinates and of a given width
@@ -1231,4 +1262,62 @@ class ThreadHelpers:
         except Exception as e:
             helpers.handleException(e)
 
-        return result
\ No newline at end of file
+        return result
+
+class HostLimiter:
+    # limits how many requests can be in flight to the same host at once.
+    # a host's semaphore is removed when nothing is using it, so there's only one for each host that's in use.
+    @contextlib.contextmanager
+    def limit(self, url):
+        host = helpers.getDomainName(url)
+
+        with self.lock:
+            item = self.semaphores.get(host)
+
+            if not item:
+                item = [threading.BoundedSemaphore(self.maximumPerHost), 0]
+                self.semaphores[host] = item
+
+            # the number of requests that are using or waiting for it
+            item[1] += 1
+
+        try:
+            with item[0]:
+                yield
+        finally:
+            with self.lock:
+                item[1] -= 1
+
+                if not item[1]:
+                    del self.semaphores[host]
+
+    # for tasks on an event loop. they all run in one thread, so no lock is needed.
+    @contextlib.asynccontextmanager
+    async def limitAsync(self, url):
+        host = helpers.getDomainName(url)
+
+        item = self.asyncSemaphores.get(host)
+
+        if not item:
+            import asyncio
+
+            item = [asyncio.BoundedSemaphore(self.maximumPerHost), 0]
+            self.asyncSemaphores[host] = item
+
+        item[1] += 1
+
+        try:
+            async with item[0]:
+                yield
+        finally:
+            item[1] -= 1
+
+            if not item[1]:
+                del self.asyncSemaphores[host]
+
+    def __init__(self, maximumPerHost):
+        self.maximumPerHost = max(1, maximumPerHost)
+        # host: [semaphore, number of users]
+        self.semaphores = {}
+        self.asyncSemaphores = {}
+        self.lock = threading.Lock()
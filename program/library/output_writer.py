@@ -0,0 +1,215 @@
+import os
+import sys
+import io
+import csv
+import gzip
+import json
+import time
+import logging
+import threading
+
+if '--debug' in sys.argv:
+    import helpers as helpers
+
+    from helpers import get
+else:
+    from . import helpers
+
+    from .helpers import get
+
+class OutputWriter:
+    # keeps the output file open and writes rows in batches. formats: csv, jsonl and csv.gz.
+    # after each batch it saves the file size and the last result id in the option table. on restart
+    # reconcile() uses that to make the file match the result table again.
+    def write(self, values):
+        with self.lock:
+            self.pendingRows.append(values)
+
+            if len(self.pendingRows) < self.batchSize and time.time() - self.lastFlush < self.batchSeconds:
+                return
+
+        self.flush()
+
+    def flush(self):
+        with self.lock:
+            self.lastFlush = time.time()
+
+            if not self.pendingRows:
+                return
+
+            rows = self.pendingRows
+            self.pendingRows = []
+
+            # the results go in first. then if it crashes before the next step, the missing rows can be made from them.
+            self.database.flush()
+
+            self.writeRows(rows)
+
+            if self.trackPosition:
+                self.savePosition()
+
+    def writeRows(self, rows):
+        self.open()
+
+        if self.format == 'jsonl':
+            for values in rows:
+                self.file.write(json.dumps(dict(zip(self.fields, values))) + '\n')
+        elif self.format == 'csv.gz':
+            # each batch is a complete gzip member, so the file can be cut after any batch
+            with gzip.GzipFile(fileobj=self.file, mode='wb') as gzipFile:
+                with io.TextIOWrapper(gzipFile, encoding='utf-8', newline='') as textFile:
+                    csv.writer(textFile).writerows(rows)
+        else:
+            # this quotes fields that contain commas
+            self.csvWriter.writerows(rows)
+
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def open(self):
+        if self.file:
+            return
+
+        helpers.makeDirectory(os.path.dirname(self.fileName))
+
+        isNew = not os.path.exists(self.fileName) or os.path.getsize(self.fileName) == 0
+
+        if self.format == 'csv.gz':
+            self.file = open(self.fileName, 'ab')
+        else:
+            self.file = open(self.fileName, 'a', encoding='utf-8', newline='')
+            self.csvWriter = csv.writer(self.file)
+
+        if isNew and self.format != 'jsonl':
+            self.writeRows([self.fields])
+
+    def close(self):
+        self.flush()
+
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+    # rows can be missing if it stopped after saving results but before writing them, and there can be extra rows
+    # if it stopped after writing them but before saving the position. getMissingRows(resultId) returns the rows
+    # for results after that id.
+    def reconcile(self, getMissingRows=None):
+        position = self.getPosition()
+        size = os.path.getsize(self.fileName) if os.path.exists(self.fileName) else 0
+
+        # first run or the file was removed or replaced. start from here.
+        if not position or size < get(position, 'size'):
+            self.savePosition()
+            return
+
+        if size > get(position, 'size'):
+            self.log.info(f'Removing {size - get(position, "size")} bytes from the end of {self.fileName} that have no results in the database')
+
+            with open(self.fileName, 'r+b') as file:
+                file.truncate(get(position, 'size'))
+
+        if getMissingRows:
+            self.writeAll(getMissingRows(get(position, 'resultId')))
+
+    # writes many rows but only saves the position at the end. if it stops part way, they're all removed next time.
+    def writeAll(self, rows):
+        self.flush()
+
+        with self.lock:
+            batch = []
+
+            for values in rows:
+                batch.append(values)
+
+                if len(batch) >= self.batchSize:
+                    self.writeRows(batch)
+                    batch = []
+
+            if batch:
+                self.writeRows(batch)
+
+            if self.trackPosition:
+                self.savePosition()
+
+    def getPosition(self):
+        row = self.database.find('option', 'value', {'name': self.getPositionName()})
+
+        return helpers.jsonStringToDictionary(get(row, 'value'))
+
+    def savePosition(self):
+        row = self.database.getFirst('result', 'max(id) as id', None)
+
+        position = {
+            'size': os.path.getsize(self.fileName) if os.path.exists(self.fileName) else 0,
+            'resultId': int(get(row, 'id') or 0)
+        }
+
+        newRow = {
+            'name': self.getPositionName(),
+            'value': json.dumps(position)
+        }
+
+        # right away instead of with the buffered inserts
+        with self.database.transaction():
+            self.database.insert('option', newRow)
+
+    def getPositionName(self):
+        return f'outputPosition {os.path.abspath(self.fileName)}'
+
+    # the rows in an output file, in any of the formats
+    def readRows(self, fileName):
+        if not os.path.exists(fileName):
+            return
+
+        if self.format == 'jsonl':
+            with open(fileName, encoding='utf-8') as file:
+                for line in file:
+                    if line.strip():
+                        row = json.loads(line)
+                        yield [get(row, field) for field in self.fields]
+
+            return
+
+        if self.format == 'csv.gz':
+            file = gzip.open(fileName, 'rt', encoding='utf-8', newline='')
+        else:
+            file = open(fileName, encoding='utf-8', newline='')
+
+        with file:
+            csvReader = csv.reader(file)
+
+            # skip the headers
+            next(csvReader, None)
+
+            for row in csvReader:
+                yield row
+
+    @staticmethod
+    def getFormat(fileName, format=''):
+        if format:
+            return format
+
+        if fileName.endswith('.jsonl'):
+            return 'jsonl'
+        elif fileName.endswith('.gz'):
+            return 'csv.gz'
+
+        return 'csv'
+
+    def __init__(self, fileName, fields, database, options, trackPosition=True):
+        self.fileName = fileName
+        self.fields = fields
+        self.database = database
+        self.log = logging.getLogger(get(options, 'loggerName'))
+        self.format = OutputWriter.getFormat(fileName, get(options, 'outputFormat'))
+        self.batchSize = int(get(options, 'outputBatchSize') or 100)
+        self.batchSeconds = float(get(options, 'outputBatchSeconds') or 5)
+        # off for temporary files, like the part files of worker processes
+        self.trackPosition = trackPosition
+
+        self.file = None
+        self.csvWriter = None
+        self.pendingRows = []
+        self.lastFlush = time.time()
+        self.lock = threading.RLock()
@@ -0,0 +1,236 @@
+import os
+import sys
+import logging
+import threading
+
+from datetime import datetime, timedelta
+
+if '--debug' in sys.argv:
+    import helpers as helpers
+
+    from helpers import get
+else:
+    from . import helpers
+
+    from .helpers import get
+
+class PageCache:
+    # keeps downloaded pages on disk. stale pages are revalidated with etag or last-modified,
+    # so an unchanged page costs a 304 response instead of a full download.
+    def getEntry(self, url):
+        if not self.maximumBytes:
+            return None
+
+        key = helpers.hash(url)
+
+        row = self.database.find('pageCache', '*', {'key': key})
+
+        if not row:
+            return None
+
+        if not os.path.exists(get(row, 'fileName')):
+            self.remove(row)
+            return None
+
+        with self.lock:
+            self.usedDates[key] = self.now()
+
+        return row
+
+    def isFresh(self, row, url):
+        hours = self.getMaximumAgeInHours(url)
+
+        # always revalidate
+        if hours <= 0:
+            return False
+
+        minimumDate = datetime.utcnow() - timedelta(hours=hours)
+        minimumDate = minimumDate.strftime('%Y-%m-%d %H:%M:%S')
+
+        return get(row, 'gmDate') >= minimumDate
+
+    def getMaximumAgeInHours(self, url):
+        domain = helpers.getDomainName(url)
+        domain = helpers.findBetween(domain, '', ':')
+
+        for item, hours in self.hoursByDomain.items():
+            if domain == item or domain.endswith(f'.{item}'):
+                return hours
+
+        return self.hours
+
+    def getBody(self, row):
+        return helpers.getFile(get(row, 'fileName'))
+
+    def getConditionalHeaders(self, row):
+        result = {}
+
+        if get(row, 'etag'):
+            result['If-None-Match'] = get(row, 'etag')
+
+        if get(row, 'lastModified'):
+            result['If-Modified-Since'] = get(row, 'lastModified')
+
+        return result
+
+    # the page didn't change since it was cached
+    def refresh(self, row, headers):
+        newRow = dict(row)
+        newRow['gmDate'] = self.now()
+        newRow['gmDateUsed'] = self.now()
+
+        if headers.get('ETag'):
+            newRow['etag'] = headers.get('ETag')
+
+        if headers.get('Last-Modified'):
+            newRow['lastModified'] = headers.get('Last-Modified')
+
+        self.database.insert('pageCache', newRow)
+
+    def store(self, url, headers, body):
+        if body is None:
+            return
+
+        item = self.startStore(url, headers)
+
+        if not item:
+            return
+
+        item['file'].write(body)
+
+        self.finishStore(item)
+
+    # for a page that arrives in pieces. write each piece to item['file'], then call finishStore() once the whole
+    # page is there or discardStore() if it isn't. returns None if the page can't be cached.
+    def startStore(self, url, headers):
+        if not self.maximumBytes:
+            return None
+
+        cacheControl = headers.get('Cache-Control', '').lower()
+
+        if 'no-store' in cacheControl or 'private' in cacheControl:
+            return None
+
+        key = helpers.hash(url)
+        fileName = os.path.join(self.directory, key[0:2], f'{key}.html')
+
+        helpers.makeDirectory(os.path.dirname(fileName))
+
+        # write to a temporary file first so other threads never see half a page
+        temporaryFileName = f'{fileName}.{os.getpid()}-{threading.get_ident()}.tmp'
+
+        return {
+            'key': key,
+            'url': url,
+            'headers': headers,
+            'fileName': fileName,
+            'temporaryFileName': temporaryFileName,
+            'file': open(temporaryFileName, 'w', encoding='utf-8')
+        }
+
+    def discardStore(self, item):
+        item['file'].close()
+
+        helpers.removeFile(item['temporaryFileName'])
+
+    def finishStore(self, item):
+        item['file'].close()
+
+        key = item['key']
+        url = item['url']
+        headers = item['headers']
+        fileName = item['fileName']
+
+        os.replace(item['temporaryFileName'], fileName)
+
+        size = os.path.getsize(fileName)
+
+        oldRow = self.database.find('pageCache', 'size', {'key': key})
+
+        newRow = {
+            'key': key,
+            'url': url,
+            'fileName': fileName,
+            'etag': headers.get('ETag', ''),
+            'lastModified': headers.get('Last-Modified', ''),
+            'size': size,
+            'gmDate': self.now(),
+            'gmDateUsed': self.now()
+        }
+
+        self.database.insert('pageCache', newRow)
+
+        with self.lock:
+            self.totalBytes += size - int(get(oldRow, 'size') or 0)
+            needsEviction = self.totalBytes > self.maximumBytes
+
+        if needsEviction:
+            self.evict()
+
+    def remove(self, row):
+        helpers.removeFile(get(row, 'fileName'))
+
+        self.database.execute('delete from pageCache where `key` = ?', params=(get(row, 'key'),))
+
+        with self.lock:
+            self.totalBytes -= int(get(row, 'size') or 0)
+
+    # removes the least recently used pages until the cache is at 90% of its limit
+    def evict(self):
+        with self.evictionLock:
+            self.save()
+
+            target = self.maximumBytes * 0.9
+
+            while self.totalBytes > target:
+                rows = self.database.get('pageCache', '`key`, fileName, size', None, 'gmDateUsed', 'asc', 100)
+
+                if not rows:
+                    break
+
+                for row in rows:
+                    self.remove(row)
+
+                    if self.totalBytes <= target:
+                        break
+
+            self.log.debug(f'Page cache is {helpers.compactNumber(self.totalBytes)}B')
+
+    # writes when pages were last used
+    def save(self):
+        with self.lock:
+            usedDates = self.usedDates
+            self.usedDates = {}
+
+        if not usedDates:
+            return
+
+        with self.database.transaction():
+            self.database.executeMany('update pageCache set gmDateUsed = ? where `key` = ?', [(gmDate, key) for key, gmDate in usedDates.items()])
+
+    def now(self):
+        return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+    def __init__(self, database, options):
+        self.database = database
+        self.log = logging.getLogger(get(options, 'loggerName'))
+        self.directory = get(options, 'pageCacheDirectory') or 'user-data/cache/pages'
+        self.maximumBytes = int(float(get(options, 'pageCacheMegabytes') or 0) * 1000 * 1000)
+        self.hours = float(get(options, 'pageCacheHours') or 0)
+
+        # for example "example.com=2 slow-changing.com=168"
+        self.hoursByDomain = {}
+
+        for item in get(options, 'pageCacheHoursByDomain').split():
+            domain = helpers.findBetween(item, '', '=')
+            hours = helpers.findBetween(item, '=', '', True)
+
+            if domain and hours:
+                self.hoursByDomain[domain] = float(hours)
+
+        self.lock = threading.Lock()
+        self.evictionLock = threading.Lock()
+        self.usedDates = {}
+
+        row = self.database.getFirst('pageCache', 'sum(size) as size', None)
+        self.totalBytes = int(get(row, 'size') or 0)
@@ -0,0 +1,201 @@
+import sys
+import logging
+import random
+import threading
+
+from datetime import datetime, timedelta
+
+if '--debug' in sys.argv:
+    import helpers as helpers
+
+    from helpers import get
+else:
+    from . import helpers
+
+    from .helpers import get
+
+class ProxyPool:
+    # chooses proxies based on how well they worked before. slow, failing and captcha'd proxies are
+    # chosen less often and are taken out of rotation for a while after a captcha or repeated errors.
+    def getProxy(self):
+        items = self.internet.getProxies()
+
+        if not items:
+            return None
+
+        now = datetime.utcnow()
+
+        with self.lock:
+            available = []
+            weights = []
+
+            for item in items:
+                score = self.getScore(self.internet.toProxyDictionary(item, False))
+
+                if score['quarantinedUntil'] and score['quarantinedUntil'] > now:
+                    continue
+
+                available.append(item)
+                weights.append(self.getWeight(score, now))
+
+            if available:
+                item = random.choices(available, weights)[0]
+            else:
+                # everything is in quarantine. use the one that gets out soonest.
+                item = min(items, key=lambda item: self.getScore(self.internet.toProxyDictionary(item, False))['quarantinedUntil'])
+
+                self.log.warning('All proxies are in quarantine')
+
+        return self.internet.toProxyDictionary(item)
+
+    # call after each request made through a proxy
+    def report(self, proxies, seconds, error=False, captcha=False):
+        if not proxies:
+            return
+
+        now = datetime.utcnow()
+
+        with self.lock:
+            score = self.getScore(proxies)
+
+            score['requests'] += 1
+
+            # recent requests count more than old ones
+            score['errorRate'] = self.smoothing * int(error or captcha) + (1 - self.smoothing) * score['errorRate']
+
+            if score['requests'] == 1:
+                score['averageSeconds'] = seconds
+            else:
+                score['averageSeconds'] = self.smoothing * seconds + (1 - self.smoothing) * score['averageSeconds']
+
+            if captcha:
+                score['captchas'] += 1
+                score['lastCaptcha'] = now
+                self.quarantine(score, now, 'has a captcha')
+            elif error:
+                score['errors'] += 1
+                score['errorsInARow'] += 1
+
+                if score['errorsInARow'] >= self.maximumErrorsInARow:
+                    self.quarantine(score, now, f'failed {score["errorsInARow"]} times in a row')
+            else:
+                score['errorsInARow'] = 0
+
+                # a working proxy slowly earns back shorter cooldowns
+                score['strikes'] = max(0, score['strikes'] - 1)
+
+            self.save(score, now)
+
+    def quarantine(self, score, now, reason):
+        minutes = min(self.cooldownMinutes * (2 ** score['strikes']), self.maximumCooldownMinutes)
+
+        score['strikes'] += 1
+        score['errorsInARow'] = 0
+        score['quarantinedUntil'] = now + timedelta(minutes=minutes)
+
+        self.log.info(f'Not using proxy {score["name"]} for {helpers.fixedDecimals(minutes, 1)} minutes. It {reason}.')
+
+    # fast proxies that rarely fail get the highest weight. new proxies get tried first.
+    def getWeight(self, score, now):
+        result = (1 - score['errorRate']) / (1 + score['averageSeconds'])
+
+        if score['lastCaptcha']:
+            hoursSinceCaptcha = (now - score['lastCaptcha']).total_seconds() / 3600
+
+            result *= min(1, hoursSinceCaptcha / self.captchaPenaltyHours)
+
+        # every proxy gets tried once in a while, so recovered ones are noticed
+        return max(result, 0.01)
+
+    def getScore(self, proxies):
+        proxy = get(proxies, 'http')
+        key = helpers.hash(proxy)
+
+        score = self.scores.get(key)
+
+        if not score:
+            score = {
+                'key': key,
+                # without the password
+                'name': helpers.findBetween(proxy, '@', '') or proxy,
+                'requests': 0,
+                'errors': 0,
+                'captchas': 0,
+                'errorRate': 0,
+                'averageSeconds': 0,
+                'errorsInARow': 0,
+                'strikes': 0,
+                'lastCaptcha': None,
+                'quarantinedUntil': None
+            }
+
+            self.scores[key] = score
+
+        return score
+
+    def save(self, score, now):
+        newRow = {
+            'key': score['key'],
+            'name': score['name'],
+            'requests': score['requests'],
+            'errors': score['errors'],
+            'captchas': score['captchas'],
+            'errorRate': score['errorRate'],
+            'averageSeconds': score['averageSeconds'],
+            'errorsInARow': score['errorsInARow'],
+            'strikes': score['strikes'],
+            'lastCaptcha': self.toString(score['lastCaptcha']),
+            'quarantinedUntil': self.toString(score['quarantinedUntil']),
+            'gmDate': self.toString(now)
+        }
+
+        self.database.insert('proxy', newRow)
+
+    def load(self):
+        for row in self.database.get('proxy'):
+            score = {
+                'key': get(row, 'key'),
+                'name': get(row, 'name'),
+                'requests': int(get(row, 'requests') or 0),
+                'errors': int(get(row, 'errors') or 0),
+                'captchas': int(get(row, 'captchas') or 0),
+                'errorRate': float(get(row, 'errorRate') or 0),
+                'averageSeconds': float(get(row, 'averageSeconds') or 0),
+                'errorsInARow': int(get(row, 'errorsInARow') or 0),
+                'strikes': int(get(row, 'strikes') or 0),
+                'lastCaptcha': self.toDate(get(row, 'lastCaptcha')),
+                'quarantinedUntil': self.toDate(get(row, 'quarantinedUntil'))
+            }
+
+            self.scores[score['key']] = score
+
+        self.log.debug(f'Loaded scores for {len(self.scores)} proxies')
+
+    def toString(self, dateObject):
+        if not dateObject:
+            return ''
+
+        return dateObject.strftime('%Y-%m-%d %H:%M:%S')
+
+    def toDate(self, string):
+        if not string:
+            return None
+
+        return datetime.strptime(string, '%Y-%m-%d %H:%M:%S')
+
+    def __init__(self, internet, database, options):
+        self.internet = internet
+        self.database = database
+        self.log = logging.getLogger(get(options, 'loggerName'))
+
+        # the first quarantine. it doubles each time the proxy goes back into quarantine.
+        self.cooldownMinutes = float(get(options, 'proxyCooldownMinutes') or 5)
+        self.maximumCooldownMinutes = float(get(options, 'proxyMaximumCooldownHours') or 6) * 60
+        self.captchaPenaltyHours = 1
+        self.maximumErrorsInARow = 3
+        self.smoothing = 0.2
+
+        self.scores = {}
+        self.lock = threading.Lock()
+
+        self.load()
@@ -0,0 +1,158 @@
+import sys
+import time
+import logging
+import asyncio
+import threading
+
+if '--debug' in sys.argv:
+    import helpers as helpers
+
+    from helpers import get
+else:
+    from . import helpers
+
+    from .helpers import get
+
+class TokenBucket:
+    # allows "rate" requests per second on average and up to "burst" requests at once
+    def reserve(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        # the token can be borrowed from the future. then the caller waits until it exists.
+        self.tokens -= 1
+
+        if self.tokens >= 0:
+            return 0
+
+        return -self.tokens / self.rate
+
+    # it would have all its tokens again, so a new bucket would be the same
+    def isFull(self, now):
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        # can be 0 when other worker processes have the burst. then every request waits for its token.
+        self.burst = max(0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+class RateLimiter:
+    # paces requests per target host and per proxy. shared by every worker thread, so the limits apply to the whole run.
+    # worker processes each have their own, so each one gets its share of the host limits.
+    def wait(self, url, proxies=None):
+        seconds = self.reserve(url, proxies)
+
+        if seconds > 0:
+            time.sleep(seconds)
+
+    async def waitAsync(self, url, proxies=None):
+        seconds = self.reserve(url, proxies)
+
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+    # takes a token for the host and the proxy. returns how many seconds to wait before sending the request.
+    def reserve(self, url, proxies=None):
+        result = 0
+
+        host = helpers.getDomainName(url)
+        host = helpers.findBetween(host, '', ':')
+
+        proxy = get(proxies, 'http') if proxies else ''
+
+        now = time.monotonic()
+
+        with self.lock:
+            self.removeFullBuckets(now)
+
+            bucket = self.getHostBucket(host)
+
+            if bucket:
+                result = max(result, bucket.reserve(now))
+
+            if proxy and self.proxyRate:
+                bucket = self.proxyBuckets.get(proxy)
+
+                if not bucket:
+                    bucket = self.getProxyBucket()
+                    self.proxyBuckets[proxy] = bucket
+
+                result = max(result, bucket.reserve(now))
+
+        if result >= 1:
+            self.log.debug(f'Waiting {helpers.fixedDecimals(result, 1)} seconds before requesting {host}')
+
+        return result
+
+    # so there aren't buckets for every host and proxy that was ever used
+    def removeFullBuckets(self, now):
+        if len(self.hostBuckets) + len(self.proxyBuckets) < self.maximumBuckets:
+            return
+
+        for buckets in [self.hostBuckets, self.proxyBuckets]:
+            for key in [key for key, bucket in buckets.items() if bucket.isFull(now)]:
+                del buckets[key]
+
+        # all of them are in use. check again later instead of every time.
+        self.maximumBuckets = max(self.maximumBuckets, (len(self.hostBuckets) + len(self.proxyBuckets)) * 2)
+
+    # worker processes share the proxies unless each one got its own part of the list
+    def getProxyBucket(self):
+        if self.workerCount > 1 and not (self.internet and self.internet.splitProxies):
+            return TokenBucket(self.proxyRate / self.workerCount, helpers.getShare(self.proxyBurst, self.workerCount, self.workerIndex))
+
+        return TokenBucket(self.proxyRate, self.proxyBurst)
+
+    def getHostBucket(self, host):
+        bucket = self.hostBuckets.get(host)
+
+        if bucket:
+            return bucket
+
+        rate = self.hostRate
+
+        for item, itemRate in self.rateByHost.items():
+            if host == item or host.endswith(f'.{item}'):
+                rate = itemRate
+                break
+
+        # not limited
+        if not rate:
+            return None
+
+        bucket = TokenBucket(rate, self.hostBurst)
+        self.hostBuckets[host] = bucket
+
+        return bucket
+
+    def __init__(self, options):
+        self.log = logging.getLogger(get(options, 'loggerName'))
+
+        # every worker process can request the same host
+        self.workerCount = int(get(options, 'workerCount') or 1)
+        self.workerIndex = int(get(options, 'workerIndex') or 0)
+
+        # 0 means no limit
+        self.hostRate = float(get(options, 'requestsPerSecondPerHost') or 0) / self.workerCount
+        self.hostBurst = helpers.getShare(float(get(options, 'burstPerHost') or 1), self.workerCount, self.workerIndex)
+        self.proxyRate = float(get(options, 'requestsPerSecondPerProxy') or 0)
+        self.proxyBurst = float(get(options, 'burstPerProxy') or 1)
+
+        # for example "google.com=0.2 example.com=5"
+        self.rateByHost = {}
+
+        for item in get(options, 'hostRateLimits').split():
+            host = helpers.findBetween(item, '', '=')
+            rate = helpers.findBetween(item, '=', '', True)
+
+            if host and rate:
+                self.rateByHost[host] = float(rate) / self.workerCount
+
+        self.hostBuckets = {}
+        self.proxyBuckets = {}
+        self.maximumBuckets = 1000
+        self.lock = threading.Lock()
+        # optional. the Internet object that knows whether the proxy list was split between worker processes.
+        self.internet = None
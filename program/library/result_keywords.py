@@ -0,0 +1,158 @@
+import sys
+import logging
+import threading
+
+from datetime import datetime, timedelta
+
+if '--debug' in sys.argv:
+    import helpers as helpers
+
+    from helpers import get
+else:
+    from . import helpers
+
+    from .helpers import get
+
+class ResultKeywords:
+    # the keywords of each result as rows of the resultKeyword table, so they can be counted and filtered
+    # with indexes instead of searching the text in result.keyword.
+    # a keyword's id comes from a hash of its text, so several processes or machines can't give it different ids.
+
+    # one row for each keyword that was found. (keywordId, url) is the primary key, so storing a result again
+    # only moves the date of its rows forward.
+    def add(self, url, keywords, gmDate):
+        newRows = []
+
+        for keyword in keywords:
+            if not keyword:
+                continue
+
+            newRow = {
+                'url': url,
+                'keywordId': self.getId(keyword),
+                'gmDate': gmDate
+            }
+
+            newRows.append(newRow)
+
+        # buffered with the other inserts
+        self.database.insert('resultKeyword', newRows)
+
+    def getId(self, keyword):
+        result = self.ids.get(keyword)
+
+        if result is not None:
+            return result
+
+        # fits in a signed 64 bit integer
+        result = int(helpers.hash(keyword)[0:15], 16)
+
+        newRow = {
+            'id': result,
+            'name': keyword
+        }
+
+        self.database.insert('keyword', newRow)
+
+        with self.lock:
+            self.ids[keyword] = result
+
+        return result
+
+    # number of domains that had each keyword in the last "days" days, from the most to the least
+    def getHitCounts(self, days=None):
+        results = {}
+
+        wherePart = ''
+        params = ()
+
+        if days:
+            wherePart = ' where gmDate >= ?'
+            params = (self.getMinimumDate(days),)
+
+        for row in self.database.execute(f'select keywordId, count(distinct url) as count from resultKeyword{wherePart} group by keywordId', True, params) or []:
+            results[int(get(row, 'keywordId'))] = int(get(row, 'count') or 0)
+
+        names = {}
+
+        for row in self.database.get('keyword', 'id, name'):
+            names[int(get(row, 'id'))] = get(row, 'name')
+
+        results = [(get(names, keywordId) or str(keywordId), count) for keywordId, count in results.items()]
+
+        return sorted(results, key=lambda item: item[1], reverse=True)
+
+    # uses the keywordId, gmDate index
+    def getHitCount(self, keyword, days=None):
+        datePart = ''
+        params = (self.getId(keyword),)
+
+        if days:
+            datePart = ' and gmDate >= ?'
+            params += (self.getMinimumDate(days),)
+
+        row = self.database.getFirst('resultKeyword', 'count(distinct url) as count', f'keywordId = ?{datePart}', params=params)
+
+        return int(get(row, 'count') or 0)
+
+    def getMinimumDate(self, days):
+        return str(datetime.utcnow() - timedelta(days=float(days)))
+
+    def removeOlderThan(self, minimumDate):
+        self.database.execute('delete from resultKeyword where gmDate < ?', params=(minimumDate,))
+
+    # fills in resultKeyword for results that were saved before it existed. can continue if it stops part way.
+    def migrate(self):
+        version = int(get(self.database.getFirst('option', 'value', "name = 'resultKeywordVersion'"), 'value') or 0)
+
+        if version >= self.version:
+            return
+
+        lastId = int(get(self.database.getFirst('option', 'value', "name = 'resultKeywordMigratedId'"), 'value') or 0)
+        maximumId = int(get(self.database.getFirst('result', 'max(id) as id', None), 'id') or 0)
+
+        if lastId < maximumId:
+            self.log.info(f'Adding the keywords of existing results to the resultKeyword table')
+
+        count = 0
+
+        while lastId < maximumId:
+            rows = self.database.get('result', 'id, url, keyword, gmDate', 'id > ? and id <= ?', 'id', 'asc', self.batchSize, params=(lastId, maximumId))
+
+            if not rows:
+                break
+
+            with self.database.transaction():
+                for row in rows:
+                    keywords = get(row, 'keyword')
+                    keywords = keywords.split(';') if keywords else []
+
+                    self.add(get(row, 'url'), keywords, get(row, 'gmDate'))
+
+                lastId = int(get(rows[-1], 'id'))
+                count += len(rows)
+
+                self.setOption('resultKeywordMigratedId', lastId)
+
+            self.log.debug(f'Added the keywords of {count} results')
+
+        with self.database.transaction():
+            self.setOption('resultKeywordVersion', self.version)
+
+    def setOption(self, name, value):
+        newRow = {
+            'name': name,
+            'value': str(value)
+        }
+
+        self.database.insert('option', newRow)
+
+    def __init__(self, database, options):
+        self.database = database
+        self.log = logging.getLogger(get(options, 'loggerName'))
+        self.batchSize = 1000
+        # increase to run the migration again
+        self.version = 1
+
+        self.ids = {}
+        self.lock = threading.Lock()
@@ -0,0 +1,171 @@
+import sys
+import socket
+import random
+import logging
+import threading
+import email.utils
+
+from datetime import datetime, timezone
+
+if '--debug' in sys.argv:
+    import helpers as helpers
+
+    from helpers import get
+else:
+    from . import helpers
+
+    from .helpers import get
+
+class RetryPolicy:
+    # decides whether a failed request is worth trying again and how long to wait first.
+    # one object can be shared by many Api objects, so the retry budget applies to the whole run.
+    def getDelay(self, attempt, exception=None, statusCode=None, headers=None, retryOnErrorStatus=True):
+        if exception:
+            if self.isFatal(exception):
+                self.log.debug(f'Not trying again. Retrying can\'t fix this error: {exception}')
+                return None
+        elif statusCode in self.retryableStatusCodes:
+            if not retryOnErrorStatus:
+                return None
+        # success or an error like 404
+        else:
+            return None
+
+        delay = self.getBackoff(attempt)
+
+        retryAfter = self.getRetryAfter(headers)
+
+        if retryAfter is not None:
+            if retryAfter > self.maximumDelay:
+                self.log.debug(f'Not trying again. The server wants a wait of {round(retryAfter)} seconds.')
+                return None
+
+            delay = max(delay, retryAfter)
+
+        if not self.useBudget():
+            return None
+
+        return delay
+
+    # the wait doubles after each try. the random part keeps many workers from retrying at the same moment.
+    def getBackoff(self, attempt):
+        delay = min(self.baseDelay * (2 ** attempt), self.maximumDelay)
+
+        return random.uniform(delay / 2, delay)
+
+    def getRetryAfter(self, headers):
+        if not headers:
+            return None
+
+        value = headers.get('Retry-After')
+
+        if not value:
+            return None
+
+        value = value.strip()
+
+        if value.isdigit():
+            return float(value)
+
+        # it can also be a date
+        try:
+            dateObject = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+
+        if not dateObject:
+            return None
+
+        if not dateObject.tzinfo:
+            dateObject = dateObject.replace(tzinfo=timezone.utc)
+
+        return max(0, (dateObject - datetime.now(timezone.utc)).total_seconds())
+
+    # call at the start of each run
+    def resetBudget(self):
+        with self.lock:
+            self.retries = 0
+            self.budgetExhausted = False
+
+    def useBudget(self):
+        with self.lock:
+            if self.retries >= self.maximumRetries:
+                if not self.budgetExhausted:
+                    self.log.warning(f'Used all {self.maximumRetries} retries for this run. Failed requests won\'t be tried again.')
+                    self.budgetExhausted = True
+
+                return False
+
+            self.retries += 1
+
+        return True
+
+    # for example the domain doesn't exist or the url is invalid
+    def isFatal(self, exception):
+        for item in self.getCauses(exception):
+            if type(item).__name__ in self.fatalExceptionNames:
+                return True
+
+            # domain doesn't exist. a temporary dns failure is still worth retrying.
+            if isinstance(item, socket.gaierror) and item.errno in self.fatalDnsErrors:
+                return True
+
+            if helpers.substringIsInList(self.fatalMessages, str(item)):
+                return True
+
+        return False
+
+    # the exception and the ones that caused it
+    def getCauses(self, exception):
+        results = []
+        toCheck = [exception]
+
+        while toCheck and len(results) < 20:
+            item = toCheck.pop()
+
+            if not isinstance(item, BaseException) or item in results:
+                continue
+
+            results.append(item)
+
+            # urllib3 and aiohttp keep the original error in these
+            toCheck += [item.__cause__, item.__context__, getattr(item, 'reason', None), getattr(item, 'os_error', None)]
+            toCheck += list(item.args)
+
+        return results
+
+    def __init__(self, options):
+        self.log = logging.getLogger(get(options, 'loggerName'))
+
+        self.baseDelay = float(get(options, 'retryDelaySeconds') or 1)
+        self.maximumDelay = float(get(options, 'maximumRetryDelaySeconds') or 60)
+        self.maximumRetries = int(get(options, 'maximumRetriesPerRun') or 1000)
+
+        # each worker process gets its share of the budget
+        self.maximumRetries = helpers.getShare(self.maximumRetries, int(get(options, 'workerCount') or 1), int(get(options, 'workerIndex') or 0))
+
+        self.retryableStatusCodes = [408, 425, 429, 500, 502, 503, 504]
+
+        self.fatalExceptionNames = [
+            'MissingSchema',
+            'InvalidSchema',
+            'InvalidURL',
+            'InvalidHeader',
+            'InvalidUrlClientError'
+        ]
+
+        self.fatalDnsErrors = [socket.EAI_NONAME]
+
+        if hasattr(socket, 'EAI_NODATA'):
+            self.fatalDnsErrors.append(socket.EAI_NODATA)
+
+        self.fatalMessages = [
+            'Name or service not known',
+            'nodename nor servname provided',
+            'No address associated with hostname',
+            'CERTIFICATE_VERIFY_FAILED'
+        ]
+
+        self.retries = 0
+        self.budgetExhausted = False
+        self.lock = threading.Lock()
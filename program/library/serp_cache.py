@@ -0,0 +1,113 @@
+import sys
+import json
+import logging
+import threading
+
+from datetime import datetime, timedelta
+
+if '--debug' in sys.argv:
+    import helpers as helpers
+
+    from helpers import get
+else:
+    from . import helpers
+
+    from .helpers import get
+
+class SerpCache:
+    # stores search results in the database so the same query isn't sent to google again too soon
+    def get(self, query, parameters):
+        result = None
+
+        if not self.maximumItems:
+            return result
+
+        key = self.getKey(query, parameters)
+
+        minimumDate = datetime.utcnow() - timedelta(hours=self.hours)
+        minimumDate = minimumDate.strftime('%Y-%m-%d %H:%M:%S')
+
+        row = self.database.find('serpCache', 'results, gmDate', {'key': key})
+
+        if get(row, 'gmDate') < minimumDate:
+            row = None
+
+        with self.lock:
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if row:
+            self.log.debug(f'Using cached search results for {query}')
+            result = json.loads(get(row, 'results') or '[]')
+
+        return result
+
+    def set(self, query, parameters, results):
+        if not self.maximumItems:
+            return
+
+        newRow = {
+            'key': self.getKey(query, parameters),
+            'query': query,
+            'results': json.dumps(results),
+            'gmDate': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        }
+
+        self.database.insert('serpCache', newRow)
+
+        with self.lock:
+            self.setsSinceEviction += 1
+
+            if self.setsSinceEviction < self.evictionInterval:
+                return
+
+            self.setsSinceEviction = 0
+
+        self.evict()
+
+    def evict(self):
+        minimumDate = datetime.utcnow() - timedelta(hours=self.hours)
+        minimumDate = minimumDate.strftime('%Y-%m-%d %H:%M:%S')
+
+        self.database.execute('delete from serpCache where gmDate < ?', params=(minimumDate,))
+
+        row = self.database.getFirst('serpCache', 'count(*) as count', None)
+        excess = int(get(row, 'count') or 0) - self.maximumItems
+
+        # remove the oldest ones
+        if excess > 0:
+            self.log.debug(f'Removing {excess} cached searches')
+            # mysql doesn't allow a limit in a subquery
+            rows = self.database.get('serpCache', '`key`', None, 'gmDate', 'asc', excess)
+
+            self.database.executeMany('delete from serpCache where `key` = ?', [(get(row, 'key'),) for row in rows])
+
+    def getKey(self, query, parameters):
+        normalized = helpers.squeezeWhitespace(query.strip().lower())
+
+        return helpers.hash(json.dumps([normalized, parameters], sort_keys=True))
+
+    def logStatistics(self):
+        total = self.hits + self.misses
+
+        if not total:
+            return
+
+        self.log.info(f'Search cache: {self.hits} hits, {self.misses} misses ({round(self.hits * 100 / total)}% hits)')
+
+    def __init__(self, database, options):
+        self.database = database
+        self.log = logging.getLogger(get(options, 'loggerName'))
+        self.hours = float(get(options, 'serpCacheHours') or 0)
+        self.maximumItems = int(get(options, 'serpCacheMaximumItems') or 0)
+
+        if not self.hours:
+            self.maximumItems = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.setsSinceEviction = 0
+        self.evictionInterval = 100
+        self.lock = threading.Lock()
@@ -13,6 +13,91 @@ else:
     
     from .helpers import get
 
+class VisibleTextTarget:
+    # receives events from lxml's parser and passes on only text a visitor would see
+    def start(self, tag, attributes):
+        if tag in self.tagsToSkip:
+            self.skipDepth += 1
+        elif tag in self.blockTags:
+            self.data(' ')
+
+    def end(self, tag):
+        if tag in self.tagsToSkip:
+            self.skipDepth = max(0, self.skipDepth - 1)
+        elif tag in self.blockTags:
+            self.data(' ')
+
+    def data(self, text):
+        if self.skipDepth or self.done:
+            return
+
+        # so keywords still match when the html has line breaks or indentation inside them
+        text = self.whitespace.sub(' ', text)
+
+        if self.lastWasSpace and text.startswith(' '):
+            text = text[1:]
+
+        if not text:
+            return
+
+        if self.maximumBytes and self.bytesWritten + len(text) >= self.maximumBytes:
+            text = text[0:self.maximumBytes - self.bytesWritten]
+            self.done = True
+
+        self.bytesWritten += len(text)
+        self.lastWasSpace = text.endswith(' ')
+
+        self.onText(text)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        return self.bytesWritten
+
+    def __init__(self, onText, maximumBytes=None):
+        import re
+
+        self.onText = onText
+        self.maximumBytes = maximumBytes
+        self.bytesWritten = 0
+        self.skipDepth = 0
+        self.lastWasSpace = True
+        self.done = False
+        self.whitespace = re.compile(r'\s+')
+
+        self.tagsToSkip = set(['script', 'style', 'template', 'svg', 'noscript'])
+        self.blockTags = set(['p', 'div', 'br', 'li', 'ul', 'ol', 'tr', 'td', 'th', 'table', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'section', 'article', 'header', 'footer', 'nav', 'title', 'option', 'blockquote', 'dd', 'dt'])
+
+class VisibleTextParser:
+    # feed it html in pieces. it parses incrementally and calls onText with the visible text.
+    # scripts, styles and comments are dropped and entities are decoded.
+    def feed(self, html):
+        if not html or self.target.done:
+            return
+
+        try:
+            self.parser.feed(html)
+        except Exception as e:
+            self.target.done = True
+            self.log.debug(f'Can\'t parse html: {e}')
+
+    def close(self):
+        try:
+            self.parser.close()
+        except Exception as e:
+            # for example an empty document
+            self.log.debug(f'Can\'t parse html: {e}')
+
+        return self.target.bytesWritten
+
+    def __init__(self, onText, maximumBytes=None, log=None):
+        from lxml import etree
+
+        self.log = log or logging.getLogger()
+        self.target = VisibleTextTarget(onText, maximumBytes)
+        self.parser = etree.HTMLParser(target=self.target, remove_comments=True, remove_pis=True)
+
 class Website:
     def getXpath(self, page, xpath, firstOnly=False, attribute=None, document=None, strip=True):
         result = []
@@ -70,6 +155,18 @@ class Website:
 
         return result
 
+    def getVisibleTextParser(self, onText, maximumBytes=None):
+        return VisibleTextParser(onText, maximumBytes, self.log)
+
+    def getVisibleText(self, page, maximumBytes=None):
+        pieces = []
+
+        parser = self.getVisibleTextParser(pieces.append, maximumBytes)
+        parser.feed(page)
+        parser.close()
+
+        return ''.join(pieces)
+
     def removeTags(self, document):
         import lxml
         
@@ -0,0 +1,387 @@
+import os
+import sys
+import logging
+import time
+import random
+import re
+import threading
+import tempfile
+import tracemalloc
+import http.server
+import urllib.parse
+
+if '--debug' in sys.argv:
+    import helpers as helpers
+
+    from helpers import get
+else:
+    import program.library.helpers as helpers
+
+    from program.library.helpers import get
+
+from program.other.keyword_finder import KeywordFinder
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    # keep-alive like real servers
+    protocol_version = 'HTTP/1.1'
+    # otherwise headers and body are separate packets and each response waits for a delayed ack
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server.standIn
+
+        host = self.headers.get('Host', '')
+        parsed = urllib.parse.urlparse(self.path)
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        statusCode = 200
+
+        if host == server.searchHost:
+            query = urllib.parse.parse_qs(parsed.query).get('q', [''])[0]
+            statusCode, body = server.getSearchPage(query)
+        else:
+            body = server.getSitePage(host, parsed.path)
+
+        body = body.encode('utf-8')
+
+        self.send_response(statusCode)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client stops reading once it found every keyword
+            pass
+
+        server.countBytes(len(body))
+
+    def log_message(self, format, *arguments):
+        pass
+
+class StandInServer:
+    # pretends to be google and every company website. requests reach it because it's set as the http proxy.
+    def getSearchPage(self, query):
+        with self.lock:
+            self.searches += 1
+            number = self.random.random()
+
+        if number < self.captchaRate:
+            with self.lock:
+                self.captchas += 1
+
+            return 429, '<html><body>Our systems have detected unusual traffic from your computer network.</body></html>'
+
+        domains = re.findall(r'site:([^\s()]+)', query)
+
+        links = []
+
+        for domain in domains:
+            if self.getRandom(domain).random() < self.noResultsRate:
+                continue
+
+            for i in range(0, self.resultsPerSearch):
+                url = f'http://{domain}/page-{i}'
+                links.append(f'<div class="g"><a class="result link" href="{url}" ping="/url?sa=t&amp;url={urllib.parse.quote(url)}"><h3>Result {i}</h3></a></div>')
+
+        if not links:
+            return 200, f'<html><body><a href="/search?q=x">google.com</a>Your search - {query} - did not match any documents.</body></html>'
+
+        # internal links are on real result pages too
+        links.append('<a href="/search?q=related&amp;start=10">Next</a>')
+
+        return 200, '<html><head><title>Google</title></head><body><div id="search">' + ''.join(links) + '</div></body></html>'
+
+    def getSitePage(self, host, path):
+        key = f'{host}{path}'
+
+        with self.lock:
+            page = self.pages.get(key)
+
+        if page:
+            return page
+
+        generator = self.getRandom(key)
+
+        parts = ['<html><head><title>', host, '</title><script>var data = {"tracking": "', 'x' * 2000, '"};</script>']
+        parts.append('<style>body { margin: 0; padding: 0; } .menu { display: none; }</style></head><body>')
+
+        size = sum([len(part) for part in parts])
+        maximumSize = self.pageKilobytes * 1000
+
+        while size < maximumSize:
+            if generator.random() < self.keywordDensity and self.keywords:
+                text = f'<p>We offer {generator.choice(self.keywords)} to businesses.</p>'
+            else:
+                text = '<p>' + ' '.join(generator.choice(self.fillerWords) for i in range(0, 40)) + '</p>'
+
+            parts.append(text)
+            size += len(text)
+
+        parts.append('</body></html>')
+
+        page = ''.join(parts)
+
+        with self.lock:
+            if len(self.pages) < 10000:
+                self.pages[key] = page
+
+        return page
+
+    def getRandom(self, key):
+        return random.Random(f'{self.seed}-{key}')
+
+    def countBytes(self, count):
+        with self.lock:
+            self.bytesSent += count
+            self.requests += 1
+
+    def start(self):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        self.server.daemon_threads = True
+        self.server.standIn = self
+
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+        # so the memory numbers only show what the keyword finder kept
+        with self.lock:
+            self.pages = {}
+
+    def __init__(self, keywords, pageKilobytes=50, keywordDensity=0.05, resultsPerSearch=3, captchaRate=0, noResultsRate=0.1, latency=0, seed=1):
+        self.keywords = keywords
+        self.pageKilobytes = pageKilobytes
+        self.keywordDensity = keywordDensity
+        self.resultsPerSearch = resultsPerSearch
+        self.captchaRate = captchaRate
+        self.noResultsRate = noResultsRate
+        self.latency = latency
+        self.seed = seed
+        self.searchHost = 'www.google.test'
+
+        self.random = random.Random(seed)
+        self.fillerWords = ['service', 'company', 'about', 'contact', 'our', 'team', 'solutions', 'business', 'customers', 'quality', 'support', 'network', 'cloud', 'security', 'local']
+        self.pages = {}
+        self.lock = threading.Lock()
+
+        self.bytesSent = 0
+        self.requests = 0
+        self.searches = 0
+        self.captchas = 0
+
+class TimedKeywordFinder(KeywordFinder):
+    # records how long each domain takes
+    def search(self, inputRow):
+        started = time.perf_counter()
+
+        try:
+            return super().search(inputRow)
+        finally:
+            self.recordTime(started)
+
+    async def searchAsync(self, inputRow, google, api):
+        started = time.perf_counter()
+
+        try:
+            return await super().searchAsync(inputRow, google, api)
+        finally:
+            self.recordTime(started)
+
+    def searchBatch(self, inputRows):
+        started = time.perf_counter()
+
+        try:
+            return super().searchBatch(inputRows)
+        finally:
+            self.recordTime(started, len(inputRows))
+
+    async def searchBatchAsync(self, inputRows, google, api):
+        started = time.perf_counter()
+
+        try:
+            return await super().searchBatchAsync(inputRows, google, api)
+        finally:
+            self.recordTime(started, len(inputRows))
+
+    # every domain in a batch takes as long as the whole batch
+    def recordTime(self, started, domains=1):
+        with self.lock:
+            self.times += [time.perf_counter() - started] * domains
+
+    def run(self):
+        try:
+            super().run()
+        finally:
+            # worker processes give their times to the main process through a file
+            if self.isWorker():
+                helpers.toFile('\n'.join(str(item) for item in self.times), self.getTimesFileName(self.options['workerIndex']))
+
+    # includes the times of the worker processes
+    def getAllTimes(self):
+        workerCount = int(get(self.options, 'workers') or 1)
+
+        if workerCount <= 1:
+            return self.times
+
+        results = []
+
+        for i in range(0, workerCount):
+            results += [float(line) for line in helpers.getLines(self.getTimesFileName(i)) if line]
+
+        return results
+
+    def getTimesFileName(self, i):
+        return os.path.join(os.path.dirname(self.options['databaseFile']), f'times-{i + 1}.txt')
+
+    def __init__(self, options, credentials):
+        super().__init__(options, credentials)
+
+        self.times = []
+
+        # never use real proxies
+        self.google.internet = None
+
+class Benchmark:
+    def run(self):
+        directory = tempfile.mkdtemp(prefix='keyword-finder-benchmark-')
+
+        keywords = [f'keyword phrase {i}' for i in range(0, self.keywordCount)]
+
+        standIn = StandInServer(keywords, self.pageKilobytes, self.keywordDensity, self.resultsPerSearch, self.captchaRate, self.noResultsRate, self.latency)
+        standIn.start()
+
+        # plain http requests to any host now go to the stand-in server
+        os.environ['HTTP_PROXY'] = standIn.url
+        os.environ['http_proxy'] = standIn.url
+        os.environ['NO_PROXY'] = ''
+        os.environ['no_proxy'] = ''
+
+        options = dict(self.options)
+
+        options['inputFile'] = os.path.join(directory, 'input.csv')
+        options['outputFile'] = os.path.join(directory, 'output.csv')
+        options['databaseFile'] = os.path.join(directory, 'database.sqlite')
+        options['keywordsFile'] = os.path.join(directory, 'keywords.txt')
+        options['keywordsCaseSensitiveFile'] = os.path.join(directory, 'keywords-case-sensitive.txt')
+        options['pageCacheDirectory'] = os.path.join(directory, 'cache')
+        options['defaultSearchUrl'] = f'http://{standIn.searchHost}'
+
+        # otherwise a captcha means waiting a minute
+        if not get(options, 'captchaRetrySeconds'):
+            options['captchaRetrySeconds'] = 1
+
+        helpers.toFile('\n'.join(keywords), options['keywordsFile'])
+        helpers.toFile('', options['keywordsCaseSensitiveFile'])
+
+        lines = ['Ds Id,Ds Company Website']
+
+        for i in range(0, self.domainCount):
+            lines.append(f'{i},company-{i}.test')
+
+        helpers.toFile('\n'.join(lines) + '\n', options['inputFile'])
+
+        keywordFinder = TimedKeywordFinder(options, {})
+
+        self.log.info(f'Running {self.domainCount} domains against {standIn.url}. Files are in {directory}.')
+
+        blocksBefore = sys.getallocatedblocks()
+
+        snapshotBefore = None
+
+        if self.traceMemory:
+            tracemalloc.start()
+            snapshotBefore = tracemalloc.take_snapshot()
+
+        started = time.perf_counter()
+
+        keywordFinder.run()
+
+        elapsed = time.perf_counter() - started
+
+        standIn.stop()
+
+        memory = {}
+
+        if self.traceMemory:
+            memory = self.getMemoryDifference(snapshotBefore, tracemalloc.take_snapshot())
+            memory['peak'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        blocksAfter = sys.getallocatedblocks()
+
+        # a domain that had a captcha is searched for again, so count the jobs instead of the searches.
+        # the job table also has the domains that the worker processes finished.
+        counts = keywordFinder.jobQueue.getCounts()
+
+        self.report(counts['done'] + counts['failed'], keywordFinder.getAllTimes(), elapsed, standIn, blocksAfter - blocksBefore, memory)
+
+    # what the run allocated and still holds, by where it was allocated
+    def getMemoryDifference(self, snapshotBefore, snapshotAfter):
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+
+        differences = snapshotAfter.filter_traces(ignore).compare_to(snapshotBefore.filter_traces(ignore), 'lineno')
+
+        return {
+            'bytes': sum(item.size_diff for item in differences),
+            'blocks': sum(item.count_diff for item in differences),
+            'top': [item for item in differences if item.size_diff > 0][0:3]
+        }
+
+    # the times are per search, including searches that are tried again
+    def report(self, domainCount, times, elapsed, standIn, newBlocks, memory):
+        domains = max(domainCount, 1)
+
+        times = sorted(times)
+
+        lines = [
+            f'Domains: {domainCount}',
+            f'Seconds: {helpers.fixedDecimals(elapsed, 2)}',
+            f'Domains per second: {helpers.fixedDecimals(domainCount / elapsed, 2)}',
+            f'Latency per domain p50: {helpers.fixedDecimals(self.getPercentile(times, 50) * 1000, 1)} ms',
+            f'Latency per domain p95: {helpers.fixedDecimals(self.getPercentile(times, 95) * 1000, 1)} ms',
+            f'Requests: {standIn.requests} ({standIn.searches} searches, {standIn.captchas} captchas)',
+            f'Bytes sent per domain: {helpers.compactNumber(standIn.bytesSent / domains, 1)}',
+            f'Memory blocks retained per domain: {helpers.fixedDecimals(newBlocks / domains, 1)}'
+        ]
+
+        if memory:
+            lines.append(f'Traced memory retained per domain: {helpers.compactNumber(memory["bytes"] / domains, 1)}B in {helpers.fixedDecimals(memory["blocks"] / domains, 1)} blocks')
+            lines.append(f'Peak traced memory: {helpers.compactNumber(memory["peak"], 1)}B')
+
+            for item in memory['top']:
+                frame = item.traceback[0]
+                lines.append(f'    {helpers.compactNumber(item.size_diff / domains, 1)}B per domain from {frame.filename}:{frame.lineno}')
+
+        print('\n'.join(lines))
+
+    def getPercentile(self, values, percentile):
+        if not values:
+            return 0
+
+        index = round((len(values) - 1) * percentile / 100)
+
+        return values[index]
+
+    def __init__(self, options):
+        self.options = options
+        self.log = logging.getLogger(get(self.options, 'loggerName'))
+
+        self.domainCount = int(helpers.getParameter('--domains', False, '200'))
+        self.keywordCount = int(helpers.getParameter('--keywords', False, '10'))
+        self.pageKilobytes = int(helpers.getParameter('--pageKilobytes', False, '50'))
+        self.keywordDensity = float(helpers.getParameter('--keywordDensity', False, '0.05'))
+        self.resultsPerSearch = int(helpers.getParameter('--resultsPerSearch', False, '3'))
+        self.captchaRate = float(helpers.getParameter('--captchaRate', False, '0'))
+        self.noResultsRate = float(helpers.getParameter('--noResultsRate', False, '0.1'))
+        self.latency = float(helpers.getParameter('--latency', False, '0')) / 1000
+        # slows everything down, so it's off by default
+        self.traceMemory = '--traceMemory' in sys.argv
@@ -4,6 +4,13 @@ import logging
 import json
 import time
 import re
+import threading
+import asyncio
+import heapq
+import random
+import multiprocessing
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from datetime import datetime, date, timedelta, timezone
 
@@ -13,6 +20,19 @@ if '--debug' in sys.argv:
     from database import Database
     from api import Api
     from google import Google
+    from other import HostLimiter
+    from keyword_matcher import KeywordMatcher
+    from website import Website
+    from bloom_filter import BloomFilter
+    from serp_cache import SerpCache
+    from page_cache import PageCache
+    from proxy_pool import ProxyPool
+    from rate_limiter import RateLimiter
+    from retry_policy import RetryPolicy
+    from job_queue import JobQueue
+    from output_writer import OutputWriter
+    from keyword_bitmap import KeywordBitmap
+    from result_keywords import ResultKeywords
 
     from helpers import get
 else:
@@ -21,6 +41,19 @@ else:
     from ..library.database import Database
     from ..library.api import Api
     from ..library.google import Google
+    from ..library.other import HostLimiter
+    from ..library.keyword_matcher import KeywordMatcher
+    from ..library.website import Website
+    from ..library.bloom_filter import BloomFilter
+    from ..library.serp_cache import SerpCache
+    from ..library.page_cache import PageCache
+    from ..library.proxy_pool import ProxyPool
+    from ..library.rate_limiter import RateLimiter
+    from ..library.retry_policy import RetryPolicy
+    from ..library.job_queue import JobQueue
+    from ..library.output_writer import OutputWriter
+    from ..library.keyword_bitmap import KeywordBitmap
+    from ..library.result_keywords import ResultKeywords
 
     from program.library.helpers import get
 
@@ -37,48 +70,447 @@ class KeywordFinder:
         self.log.info('Starting search')
         
         self.gmDateStarted = datetime.utcnow()
-        self.newResults = []
         self.optionsFromDatabase = self.getOptionsFromDatabase()
-        self.inputRows = self.getInputRows()
-        self.removeOldEntries()
 
-        newRow = {
-            'name': 'lastRunDate',
-            'value': self.gmDateStarted.strftime('%Y-%m-%d %H:%M:%S')
-        }
+        if self.isWorker():
+            # the main process already loaded the jobs
+            self.inputRowCount = self.jobQueue.getTotal()
+        else:
+            self.removeOldEntries()
 
-        self.database.insert('option', newRow)
+            # so two machines don't both do it
+            with self.jobQueue.lockJobs():
+                self.resultKeywords.migrate()
 
-        for i, inputRow in enumerate(self.inputRows):
-            try:
-                self.logHistory(f'On item {i + 1} of {len(self.inputRows)}: {get(inputRow, "Ds Company Website")}.')
-                self.search(inputRow)
-            except Exception as e:
-                helpers.handleException(e)
+            # only reads the input if it's new or the previous run finished
+            self.inputRowCount = self.jobQueue.start(self.getInputRows, self.getInputSignature())
+
+            newRow = {
+                'name': 'lastRunDate',
+                'value': self.gmDateStarted.strftime('%Y-%m-%d %H:%M:%S')
+            }
+
+            self.database.insert('option', newRow)
+
+            self.removePartFiles()
+
+            # other machines write to the result table too, so only this machine's own rows can be checked
+            if self.database.type == 'mysql':
+                self.outputWriter.reconcile()
+            else:
+                self.outputWriter.reconcile(self.getMissingOutputRows)
+
+            workerCount = int(get(self.options, 'workers') or 1)
+
+            if workerCount > 1:
+                self.runWorkers(workerCount)
+                self.updateKeywordBitmap()
+                return
+
+        self.loadDoneUrls()
+
+        concurrency = int(get(self.options, 'concurrency') or 1)
+
+        self.deferred = []
+        self.captchaAttempts = {}
+        self.retryPolicy.resetBudget()
+        self.jobQueue.startHeartbeat()
+
+        try:
+            if get(self.options, 'useAsync'):
+                self.log.info(f'Processing {concurrency} domains at a time using asyncio')
+            elif concurrency > 1:
+                self.log.info(f'Processing {concurrency} domains at a time')
+
+            self.processBatches(self.getBatches(), concurrency)
+            self.processDeferred(concurrency)
+            self.updateKeywordBitmap()
+        finally:
+            self.jobQueue.stopHeartbeat()
+            # write anything that's still buffered, even if something went wrong
+            self.outputWriter.flush()
+            self.jobQueue.flush()
+            self.database.flush()
+            self.serpCache.logStatistics()
+            self.pageCache.save()
+
+    # starts a process for each part of the input. each one uses its own cpu core.
+    def runWorkers(self, workerCount):
+        self.log.info(f'Starting {workerCount} worker processes')
+
+        maximumRequestsPerHost = int(get(self.options, 'maximumRequestsPerHost') or 1)
+
+        # a worker can't have less than one connection
+        if maximumRequestsPerHost < workerCount:
+            self.log.warning(f'maximumRequestsPerHost is {maximumRequestsPerHost}, which is less than the {workerCount} workers. Each worker can still have one connection to a host at a time, so a host can get up to {workerCount}.')
+
+        # so the workers see everything
+        self.jobQueue.flush()
+        self.database.flush()
+
+        # a fresh process instead of a copy of this one, which has open connections and threads
+        context = multiprocessing.get_context('spawn')
+
+        processes = []
+
+        for i in range(0, workerCount):
+            options = dict(self.options)
+            options['workerIndex'] = i
+            options['workerCount'] = workerCount
+            options['outputFile'] = self.getPartFileName(i)
+
+            process = context.Process(target=type(self).runWorker, args=(options, self.credentials, i), name=f'worker-{i + 1}')
+            process.start()
+
+            processes.append(process)
+
+        for process in processes:
+            process.join()
+
+            if process.exitcode:
+                self.log.error(f'{process.name} stopped with exit code {process.exitcode}')
+
+        self.mergeOutputFiles(workerCount)
+
+        counts = self.jobQueue.getCounts()
+
+        self.log.info(f'Workers finished. {counts["done"]} domains done, {counts["failed"]} failed, {counts["pending"] + counts["in-progress"]} left.')
+
+    # a class method, so a subclass's workers are that subclass too
+    @classmethod
+    def runWorker(cls, options, credentials, i):
+        helpers.setUpLogging('user-data/logs', f'-{i + 1}')
+
+        try:
+            keywordFinder = cls(options, credentials)
+            keywordFinder.run()
+        except Exception as e:
+            helpers.handleException(e)
+
+    def isWorker(self):
+        return 'workerIndex' in self.options
+
+    def getPartFileName(self, i):
+        base, extension = os.path.splitext(self.options['outputFile'])
+
+        return f'{base}.part-{i + 1}{extension}'
+
+    # each worker writes its own file, so they never write to the same file at once
+    def mergeOutputFiles(self, workerCount):
+        partFileNames = [self.getPartFileName(i) for i in range(0, workerCount)]
+
+        # all in one go. the workers' results are already in the database, so if this stops part way
+        # the next run adds them from there.
+        self.outputWriter.writeAll(row for partFileName in partFileNames for row in self.outputWriter.readRows(partFileName))
+
+        for partFileName in partFileNames:
+            helpers.removeFile(partFileName)
+
+        self.log.info(f'Results are in {self.options["outputFile"]}')
+
+    # from a run that stopped part way. the rows in them are added again from the result table.
+    def removePartFiles(self):
+        base, extension = os.path.splitext(self.options['outputFile'])
+        directory = os.path.dirname(base) or '.'
+        prefix = os.path.basename(base) + '.part-'
+
+        if not os.path.exists(directory):
+            return
+
+        for fileName in os.listdir(directory):
+            if fileName.startswith(prefix) and fileName.endswith(extension):
+                self.log.debug(f'Removing {fileName}')
+                helpers.removeFile(os.path.join(directory, fileName))
+
+    def processBatches(self, batches, concurrency):
+        if get(self.options, 'useAsync'):
+            asyncio.run(self.runAsync(batches, concurrency))
+        elif concurrency <= 1:
+            for batch in batches:
+                self.processBatch(batch)
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='worker') as executor:
+                futures = set()
+
+                # only claims more work when a worker is about to be free
+                for batch in batches:
+                    if len(futures) >= concurrency * 2:
+                        done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                        self.checkFutures(done)
+
+                    futures.add(executor.submit(self.processBatch, batch))
+
+                # makes sure nothing gets lost
+                done, futures = wait(futures)
+                self.checkFutures(done)
+
+    def checkFutures(self, futures):
+        for future in futures:
+            future.result()
+
+    # tries the rows that had a captcha again, once their wait is over
+    def processDeferred(self, concurrency):
+        while True:
+            with self.lock:
+                if not self.deferred:
+                    break
+
+                seconds = self.deferred[0][0] - time.time()
+
+            if seconds > 0:
+                self.log.info(f'Waiting {round(seconds)} seconds to try {len(self.deferred)} groups of domains that had a captcha again')
+                time.sleep(seconds)
+
+            batches = []
+
+            with self.lock:
+                while self.deferred and self.deferred[0][0] <= time.time():
+                    batches.append(heapq.heappop(self.deferred)[2])
+
+            self.processBatches(batches, concurrency)
+
+    # search again later. by then the proxy pool will have chosen a different proxy.
+    def defer(self, inputRows):
+        attempts = 0
+        batch = []
+
+        with self.lock:
+            for inputRow in inputRows:
+                url = get(inputRow, 'Ds Company Website')
+
+                self.captchaAttempts[url] = self.captchaAttempts.get(url, 0) + 1
+
+                if self.captchaAttempts[url] > self.maximumCaptchaAttempts:
+                    self.log.error(f'Skipping {url}. There was a captcha {self.maximumCaptchaAttempts} times.')
+                    self.finishJob(inputRow, 'failed', 'captcha')
+                    continue
+
+                attempts = max(attempts, self.captchaAttempts[url])
+
+                # the row number isn't needed anymore
+                batch.append((None, inputRow))
+
+            if not batch:
+                return
+
+            # wait longer each time. the random part keeps the retries from all happening at once.
+            seconds = self.captchaRetrySeconds * (2 ** (attempts - 1))
+            seconds *= random.uniform(0.75, 1.25)
+
+            self.deferredCount += 1
+
+            heapq.heappush(self.deferred, (time.time() + seconds, self.deferredCount, batch))
+
+        self.log.info(f'There is a captcha. Will try {len(batch)} domains again in {round(seconds)} seconds.')
+
+    def logItem(self, i, inputRow):
+        site = get(inputRow, "Ds Company Website")
+
+        if i is None:
+            self.logHistory(f'Trying {site} again.')
+        else:
+            self.logHistory(f'On item {i + 1} of {self.inputRowCount}: {site}.')
+
+    # groups of rows whose domains can be searched for with one query. claims them from the job queue as it goes.
+    def getBatches(self):
+        domainsPerSearch = int(get(self.options, 'domainsPerSearch') or 1)
+
+        # each claim is a transaction, so claim more than one batch at a time
+        jobsPerClaim = max(domainsPerSearch, 100)
+
+        while True:
+            jobs = self.jobQueue.claim(jobsPerClaim)
+
+            if not jobs:
+                break
+
+            for i in range(0, len(jobs), domainsPerSearch):
+                yield [(jobId - 1, inputRow) for jobId, inputRow in jobs[i:i + domainsPerSearch]]
+
+    # the job failed, unless it finished before the exception
+    def handleBatchException(self, e, batch):
+        helpers.handleException(e)
+
+        for i, inputRow in batch:
+            self.finishJob(inputRow, 'failed', e)
+
+    def processBatch(self, batch):
+        if len(batch) == 1:
+            self.processInputRow(batch[0][0], batch[0][1])
+            return
+
+        try:
+            for i, inputRow in batch:
+                self.logItem(i, inputRow)
+
+            self.searchBatch([inputRow for i, inputRow in batch])
+        except Exception as e:
+            self.handleBatchException(e, batch)
+
+    def processInputRow(self, i, inputRow):
+        try:
+            self.logItem(i, inputRow)
+            self.search(inputRow)
+        except Exception as e:
+            self.handleBatchException(e, [(i, inputRow)])
 
     def search(self, inputRow):
+        url = self.getUrlToSearch(inputRow)
+
+        if not url:
+            return
+
+        self.searchDomain(inputRow, url)
+
+    def searchDomain(self, inputRow, url):
+        google = self.getGoogle()
+
+        urls = google.search(self.getQuery(url))
+
+        if google.captcha:
+            self.defer([inputRow])
+            return
+
+        self.checkUrls(inputRow, url, urls)
+
+    # searches for several domains at once
+    def searchBatch(self, inputRows):
+        for group in self.getQueryGroups(inputRows):
+            self.searchGroup(group)
+
+    def searchGroup(self, group):
+        if len(group) == 1:
+            self.searchDomain(group[0][0], group[0][1])
+            return
+
+        google = self.getGoogle()
+
+        urls = google.search(self.getBatchQuery(group))
+
+        if google.captcha:
+            self.defer([inputRow for inputRow, url in group])
+            return
+
+        # any of the domains may have lost results to the others
+        if self.isSaturated(urls):
+            for half in self.splitGroup(group):
+                self.searchGroup(half)
+
+            return
+
+        for inputRow, url, domainUrls in self.getBatchResults(group, urls):
+            self.checkUrls(inputRow, url, domainUrls)
+
+    def checkUrls(self, inputRow, url, urls):
+        matchingKeywords = []
+        
+        for searchResultUrl in self.getUrlsToCheck(url, urls):
+            matchingKeywords += self.getMatchingKeywords(searchResultUrl)
+
+        self.saveResult(inputRow, url, matchingKeywords)
+
+    def getUrlToSearch(self, inputRow):
         url = get(inputRow, 'Ds Company Website')
 
+        # the same domain can be in the input more than once. only one row at a time checks it.
+        with self.lock:
+            inFlight = self.inFlightUrls.get(url)
+
+            if inFlight and inFlight['job'] != inputRow['job']:
+                # gets the same status as the row that's checking it
+                inFlight['waiting'].append(inputRow['job'])
+                return ''
+
+            if not inFlight:
+                self.inFlightUrls[url] = {'job': inputRow['job'], 'waiting': []}
+
         if self.alreadyDone(url):
-            return
+            self.finishJob(inputRow, 'done')
+            return ''
 
         if not url.startswith('http'):
             url = 'http://' + url
 
+        return url
+
+    def getQuery(self, url):
         domainToUse = helpers.getDomainName(url)
 
+        query = self.getKeywordQuery()
+
+        return f'site:{domainToUse} {query}'
+
+    def getKeywordQuery(self):
         queryList = []
 
         for keyword in self.keywords:
             queryList.append(f'"{keyword}"')
 
-        query = ' OR '.join(queryList)
+        return ' OR '.join(queryList)
 
-        urls = self.google.search(f'site:{domainToUse} {query}')
+    # for example (site:a.com OR site:b.com) ("keyword 1" OR "keyword 2")
+    def getBatchQuery(self, group):
+        sites = [f'site:{helpers.getDomainName(url)}' for inputRow, url in group]
 
-        if self.google.captcha:
-            self.log.error(f'Skipping this line. There is a captcha.')
-            return
+        sites = ' OR '.join(sites)
+        query = self.getKeywordQuery()
+
+        return f'({sites}) ({query})'
+
+    # returns lists of (input row, url) that fit in one query. skips rows that are already done.
+    def getQueryGroups(self, inputRows):
+        results = []
+        group = []
+
+        for inputRow in inputRows:
+            url = self.getUrlToSearch(inputRow)
+
+            if not url:
+                continue
+
+            newGroup = group + [(inputRow, url)]
+
+            # google ignores the end of very long queries
+            if group and len(self.getBatchQuery(newGroup)) > self.maximumQueryLength:
+                results.append(group)
+                newGroup = [(inputRow, url)]
+
+            group = newGroup
+
+        if group:
+            results.append(group)
+
+        return results
+
+    # google only returns so many results. then the domains are searched for again in smaller groups.
+    def isSaturated(self, urls):
+        return len(urls) >= self.resultsPerSearch
+
+    def splitGroup(self, group):
+        middle = len(group) // 2
+
+        self.log.debug(f'The combined search for {len(group)} domains had a full page of results. Searching for them in two groups.')
+
+        return [group[0:middle], group[middle:]]
+
+    # returns (input row, url, search results for that domain) for each item in the group
+    def getBatchResults(self, group, urls):
+        domainUrls = [[] for item in group]
+
+        for searchResultUrl in urls:
+            domain = helpers.getDomainName(searchResultUrl)
+
+            for i, item in enumerate(group):
+                groupDomain = helpers.getDomainName(item[1])
+
+                if domain == groupDomain or domain.endswith(f'.{groupDomain}'):
+                    domainUrls[i].append(searchResultUrl)
+                    break
+
+        return [(inputRow, url, domainUrls[i]) for i, (inputRow, url) in enumerate(group)]
+
+    def getUrlsToCheck(self, url, urls):
+        results = []
 
         self.log.info(f'Results from google: {urls}')
 
@@ -86,54 +518,255 @@ class KeywordFinder:
         if not urls:
             urls.append(url)
 
-        matchingKeywords = []
-        
         for searchResultUrl in urls:
             if helpers.getBasicDomainName(searchResultUrl) != helpers.getBasicDomainName(url):
                 continue
 
-            matchingKeywords += self.getMatchingKeywords(searchResultUrl)
+            results.append(searchResultUrl)
 
-        matchingKeywords = ';'.join(matchingKeywords)
+        return results
 
-        newResult = {
-            'url': url,
-            'keyword': matchingKeywords
-        }
+    def saveResult(self, inputRow, url, matchingKeywords):
+        with self.lock:
+            self.store(inputRow, url, matchingKeywords)
 
-        self.newResults.append(newResult)
-        self.store(inputRow, url, matchingKeywords)
+        self.finishJob(inputRow, 'done')
 
         if not matchingKeywords:
             self.logHistory(f'No results for {url}')
 
-    def getMatchingKeywords(self, searchResultUrl):
-        # default to none, in case can't find which keyword matches
-        # google may have search results that don't actually contain any of the keywords
-        results = []
+    # also finishes the rows with the same domain that were waiting for this one
+    def finishJob(self, inputRow, status, error=''):
+        url = get(inputRow, 'Ds Company Website')
+        job = inputRow['job']
+        jobs = [job]
 
-        api = Api('', self.options)
+        with self.lock:
+            inFlight = self.inFlightUrls.get(url)
+
+            if inFlight and inFlight['job'] == job:
+                jobs += self.inFlightUrls.pop(url)['waiting']
+            elif inFlight and job in inFlight['waiting']:
+                # finishes when the row that's checking the domain does
+                return
+
+        for jobId, claimToken in jobs:
+            if status == 'done':
+                self.jobQueue.markDone(jobId, claimToken)
+            else:
+                self.jobQueue.markFailed(jobId, claimToken, error)
+
+    def getMatchingKeywords(self, searchResultUrl):
+        api = self.getApi()
         
         self.log.info(f'Checking {searchResultUrl}')
 
-        page = api.getPlain(searchResultUrl)
-        lowercasePage = page.lower()
+        scanner, onText, textParser = self.getPageScanner()
 
-        for keyword in self.keywords:
-            if keyword.lower() in lowercasePage:
-                self.log.info(f'New result: {keyword}')
-                results.append(keyword)                
+        with self.hostLimiter.limit(searchResultUrl):
+            if get(self.options, 'streamPages'):
+                # stops downloading once every keyword is found
+                api.getStreaming(searchResultUrl, onText, self.options.get('maximumPageBytes'), scanner.foundAll)
+            else:
+                onText(api.getPlain(searchResultUrl))
+
+        if textParser:
+            textParser.close()
 
-        for keyword in self.keywordsCaseSensitive:
-            if keyword in page:
-                self.log.info(f'New result: {keyword}')
-                results.append(keyword)
+        return self.logMatchingKeywords(searchResultUrl, scanner.getMatchingKeywords())
+
+    # returns the scanner, the function to give the page to and the text parser if there is one
+    def getPageScanner(self):
+        scanner = self.keywordMatcher.getScanner()
+
+        if not get(self.options, 'matchVisibleTextOnly'):
+            return scanner, scanner.feed, None
+
+        # ignores scripts, styles, comments and attributes
+        textParser = self.website.getVisibleTextParser(scanner.feed, self.options.get('maximumTextBytes'))
+
+        return scanner, textParser.feed, textParser
+
+    def logMatchingKeywords(self, searchResultUrl, matchingKeywords):
+        # default to none, in case can't find which keyword matches
+        # google may have search results that don't actually contain any of the keywords
+        results = []
+
+        for keyword in matchingKeywords:
+            self.log.info(f'New result: {keyword}')
+            results.append(keyword)
 
         if not results:
             self.log.info(f'No keywords are on {searchResultUrl}')
 
         return results
 
+    # each worker is a task on the event loop with its own google object, so thousands of pages can be in flight at once
+    async def runAsync(self, batches, concurrency):
+        if '--debug' in sys.argv:
+            from async_api import AsyncApi
+        else:
+            from ..library.async_api import AsyncApi
+
+        queue = asyncio.Queue(maxsize=concurrency * 2)
+
+        workers = []
+
+        for i in range(0, concurrency):
+            api = self.configureApi(AsyncApi('', self.options))
+
+            workers.append(asyncio.create_task(self.asyncWorker(queue, self.newGoogle(), api)))
+
+        # the deferred batches are a list
+        batches = iter(batches)
+
+        try:
+            while True:
+                # claiming from the job queue is a database transaction
+                batch = await helpers.runInThread(next, batches, None)
+
+                if batch is None:
+                    break
+
+                await queue.put(batch)
+
+            # tells the workers to stop
+            for worker in workers:
+                await queue.put(None)
+
+            await asyncio.gather(*workers)
+        finally:
+            await AsyncApi.closeSessions()
+
+    async def asyncWorker(self, queue, google, api):
+        while True:
+            batch = await queue.get()
+
+            if batch is None:
+                break
+
+            try:
+                for i, inputRow in batch:
+                    self.logItem(i, inputRow)
+
+                if len(batch) == 1:
+                    await self.searchAsync(batch[0][1], google, api)
+                else:
+                    await self.searchBatchAsync([inputRow for i, inputRow in batch], google, api)
+            except Exception as e:
+                await helpers.runInThread(self.handleBatchException, e, batch)
+
+    # the database work in these runs in a thread, so it doesn't block the other tasks
+    async def searchAsync(self, inputRow, google, api):
+        url = await helpers.runInThread(self.getUrlToSearch, inputRow)
+
+        if not url:
+            return
+
+        await self.searchDomainAsync(inputRow, url, google, api)
+
+    async def searchDomainAsync(self, inputRow, url, google, api):
+        urls = await google.searchAsync(self.getQuery(url))
+
+        if google.captcha:
+            await helpers.runInThread(self.defer, [inputRow])
+            return
+
+        await self.checkUrlsAsync(inputRow, url, urls, api)
+
+    # see searchBatch
+    async def searchBatchAsync(self, inputRows, google, api):
+        for group in await helpers.runInThread(self.getQueryGroups, inputRows):
+            await self.searchGroupAsync(group, google, api)
+
+    async def searchGroupAsync(self, group, google, api):
+        if len(group) == 1:
+            await self.searchDomainAsync(group[0][0], group[0][1], google, api)
+            return
+
+        urls = await google.searchAsync(self.getBatchQuery(group))
+
+        if google.captcha:
+            await helpers.runInThread(self.defer, [inputRow for inputRow, url in group])
+            return
+
+        if self.isSaturated(urls):
+            for half in self.splitGroup(group):
+                await self.searchGroupAsync(half, google, api)
+
+            return
+
+        for inputRow, url, domainUrls in self.getBatchResults(group, urls):
+            await self.checkUrlsAsync(inputRow, url, domainUrls, api)
+
+    async def checkUrlsAsync(self, inputRow, url, urls, api):
+        matchingKeywords = []
+
+        for searchResultUrl in self.getUrlsToCheck(url, urls):
+            matchingKeywords += await self.getMatchingKeywordsAsync(searchResultUrl, api)
+
+        await helpers.runInThread(self.saveResult, inputRow, url, matchingKeywords)
+
+    async def getMatchingKeywordsAsync(self, searchResultUrl, api):
+        self.log.info(f'Checking {searchResultUrl}')
+
+        scanner, onText, textParser = self.getPageScanner()
+
+        async with self.hostLimiter.limitAsync(searchResultUrl):
+            if get(self.options, 'streamPages'):
+                await api.getStreaming(searchResultUrl, onText, self.options.get('maximumPageBytes'), scanner.foundAll)
+            else:
+                onText(await api.getPlain(searchResultUrl))
+
+        if textParser:
+            textParser.close()
+
+        return self.logMatchingKeywords(searchResultUrl, scanner.getMatchingKeywords())
+
+    def getGoogle(self):
+        # each worker thread needs its own search state, for example the captcha flag
+        if threading.current_thread() is threading.main_thread():
+            return self.google
+
+        google = getattr(self.threadData, 'google', None)
+
+        if not google:
+            google = self.newGoogle()
+            self.threadData.google = google
+
+        return google
+
+    def newGoogle(self):
+        result = Google(self.options)
+
+        # share the proxy list instead of loading it again
+        result.internet = self.google.internet
+        result.serpCache = self.serpCache
+        result.api.rateLimiter = self.rateLimiter
+        result.api.retryPolicy = self.retryPolicy
+
+        return result
+
+    def getApi(self):
+        if threading.current_thread() is threading.main_thread():
+            return self.api
+
+        api = getattr(self.threadData, 'api', None)
+
+        if not api:
+            api = self.configureApi(Api('', self.options))
+            self.threadData.api = api
+
+        return api
+
+    # gives an api object for website pages the objects that every worker shares
+    def configureApi(self, api):
+        api.pageCache = self.pageCache
+        api.rateLimiter = self.rateLimiter
+        api.retryPolicy = self.retryPolicy
+
+        return api
+
     def logHistory(self, text):
         self.log.info(text)
 
@@ -144,10 +777,29 @@ class KeywordFinder:
 
         self.database.insert('history', newRow)
 
+    def loadDoneUrls(self):
+        count = self.database.getFirst('result', 'count(*) as count', None)
+        count = int(get(count, 'count') or 0)
+
+        # room for what this run adds
+        self.doneUrls = BloomFilter(count + self.inputRowCount + 1000)
+
+        for row in self.database.iterate('select url from result'):
+            url = get(row, 'url')
+
+            if url:
+                self.doneUrls.add(url)
+
+        self.log.debug(f'Loaded {count} finished urls')
+
     def alreadyDone(self, url):
         result = False
 
-        row = self.database.getFirst('result', '*', f"url = '{self.database.escape(url)}'")
+        # definitely not done. avoids a database lookup for most new rows.
+        if not url in self.doneUrls:
+            return result
+
+        row = self.database.find('result', '*', {'url': url})
 
         if row:
             self.log.info(f'Skipping {url}. Already done.')
@@ -158,39 +810,58 @@ class KeywordFinder:
     def store(self, inputRow, url, matchingKeywords):
         newRow = {
             'url': get(inputRow, 'Ds Company Website'),
+            'inputId': get(inputRow, 'Ds Id'),
             'matchingUrl': url,
-            'keyword': matchingKeywords,
+            'keyword': ';'.join(matchingKeywords),
             'gmDate': str(datetime.utcnow()),
         }
 
+        # the caller holds the lock, so the result and its output row are buffered together
         self.database.insert('result', newRow)
+        self.resultKeywords.add(newRow['url'], matchingKeywords, newRow['gmDate'])
+        self.doneUrls.add(newRow['url'])
 
-        outputFile = self.options['outputFile']
-        
-        fields = ['Ds Id', 'Ds Company Website']
+        self.outputWriter.write(self.getOutputValues(newRow['inputId'], newRow['url'], matchingKeywords))
 
-        for keyword in self.keywords:
-            fields.append(keyword)
+    def updateKeywordBitmap(self):
+        if not self.keywordBitmap:
+            return
+
+        # so it sees every result
+        self.database.flush()
 
-        if not os.path.exists(outputFile):
-            helpers.makeDirectory('user-data/output')
-            helpers.toFile(','.join(fields) + '\n', outputFile)
+        self.keywordBitmap.update(self.database)
 
+    def getOutputFields(self):
+        return ['Ds Id', 'Ds Company Website'] + self.keywords
+
+    def getOutputValues(self, inputId, website, matchingKeywords):
         values = [
-            get(inputRow, 'Ds Id'),
-            get(inputRow, 'Ds Company Website'),
+            inputId,
+            website
         ]
 
-        matchingKeywordsList = matchingKeywords.split(';')
+        matchingKeywords = set(matchingKeywords)
 
         for keyword in self.keywords:
-            if keyword in matchingKeywordsList:
+            if keyword in matchingKeywords:
                 values.append(keyword)
             else:
                 values.append('')
 
-        # this quotes fields that contain commas
-        helpers.appendCsvFile(values, outputFile)
+        return values
+
+    # output rows for results that were saved but not written to the output file
+    def getMissingOutputRows(self, resultId):
+        count = 0
+
+        for row in self.database.iterate('select url, inputId, keyword from result where id > ? order by id', params=(int(resultId),)):
+            count += 1
+
+            yield self.getOutputValues(get(row, 'inputId'), get(row, 'url'), get(row, 'keyword').split(';'))
+
+        if count:
+            self.log.info(f'Added {count} results to the output file that were missing from it')
 
     def getOptionsFromDatabase(self):
         result = {}
@@ -205,23 +876,23 @@ class KeywordFinder:
 
         return result
 
-    def getInputRows(self):
-        results = []
+    def getInputSignature(self):
+        return JobQueue.getSignature(self.options['inputFile'], get(self.optionsFromDatabase, 'urls'))
 
+    # a generator, so a large input file is never all in memory
+    def getInputRows(self):
         urls = get(self.optionsFromDatabase, 'urls')
 
-        for url in urls.splitlines():
-            inputRow = {
-                'url': helpers.findBetween(url, '', ' '),
-                'keywords': helpers.findBetween(url, ' ', '', True)
-            }
-
-            results.append(inputRow)
+        if urls:
+            for url in urls.splitlines():
+                yield {
+                    'url': helpers.findBetween(url, '', ' '),
+                    'keywords': helpers.findBetween(url, ' ', '', True)
+                }
 
-        if not results:
-            results = helpers.getCsvFile(self.options['inputFile'])
+            return
 
-        return results
+        yield from helpers.iterateCsvFile(self.options['inputFile'])
 
     def waitForNextRun(self):
         hours = get(self.optionsFromDatabase, 'hoursBetweenRuns')
@@ -271,6 +942,23 @@ class KeywordFinder:
 
         self.log.info('Done waiting')
 
+    # sqlite by default. with databaseType=mysql several machines can share the jobs and results.
+    def openDatabase(self):
+        if get(self.options, 'databaseType') != 'mysql':
+            return Database(get(self.options, 'databaseFile') or 'user-data/database.sqlite')
+
+        name = {
+            'host': get(self.options, 'databaseHost') or 'localhost',
+            'port': get(self.options, 'databasePort') or 3306,
+            'user': get(self.options, 'databaseUser') or 'root',
+            'password': get(self.credentials, 'databasePassword') or get(self.options, 'databasePassword'),
+            'database': get(self.options, 'databaseName') or 'keyword_finder'
+        }
+
+        self.log.info(f'Using the MySQL database {name["database"]} on {name["host"]}')
+
+        return Database(name, 'mysql')
+
     def removeOldEntries(self):
         maximumDaysToKeepItems = self.options['maximumDaysToKeepItems']
 
@@ -278,21 +966,89 @@ class KeywordFinder:
         
         self.log.debug(f'Deleting entries older than {maximumDaysToKeepItems} days')
         
-        self.database.execute(f"delete from result where gmDate < '{minimumDate}'")
-        self.database.execute(f"delete from history where gmDate < '{minimumDate}'")
+        self.database.execute('delete from result where gmDate < ?', params=(minimumDate,))
+        self.database.execute('delete from history where gmDate < ?', params=(minimumDate,))
+        self.resultKeywords.removeOlderThan(minimumDate)
+
+    # number of domains that had each keyword
+    def logKeywordReport(self, days):
+        self.log.info(f'Domains with each keyword in the last {days} days:')
+
+        for keyword, count in self.resultKeywords.getHitCounts(days):
+            self.log.info(f'{keyword}: {count}')
 
     def __init__(self, options, credentials):
         self.options = options
+        self.credentials = credentials
         self.log = logging.getLogger(get(self.options, 'loggerName'))
-        self.newResults = []
+        self.doneUrls = BloomFilter(1000)
+        # url: the job that's checking it and the jobs with the same url that are waiting for it
+        self.inFlightUrls = {}
         
-        self.keywords = helpers.getFile('user-data/input/keywords.txt')
+        self.keywords = helpers.getFile(get(self.options, 'keywordsFile') or 'user-data/input/keywords.txt')
         self.keywords = self.keywords.splitlines()
 
-        self.keywordsCaseSensitive = helpers.getFile('user-data/input/keywords-case-sensitive.txt')
+        self.keywordsCaseSensitive = helpers.getFile(get(self.options, 'keywordsCaseSensitiveFile') or 'user-data/input/keywords-case-sensitive.txt')
         self.keywordsCaseSensitive = self.keywordsCaseSensitive.splitlines()
 
-        self.database = Database('user-data/database.sqlite')
+        # finds both kinds of keywords in one pass over each page
+        self.keywordMatcher = KeywordMatcher(self.keywords, self.keywordsCaseSensitive)
+        self.website = Website(self.options)
+
+        self.database = self.openDatabase()
         self.database.makeTables('program/resources/tables.json')
+        self.database.setWriteBehind(int(get(self.options, 'databaseBatchSize') or 0), int(get(self.options, 'databaseBatchSeconds') or 0))
+
+        # the cached pages are files on this machine, so their index stays here too
+        self.localDatabase = self.database
+
+        if self.database.type == 'mysql':
+            self.localDatabase = Database(get(self.options, 'databaseFile') or 'user-data/database.sqlite')
+            self.localDatabase.makeTables('program/resources/tables.json')
         
-        self.google = Google(self.options)
\ No newline at end of file
+        self.serpCache = SerpCache(self.database, self.options)
+        self.rateLimiter = RateLimiter(self.options)
+        self.retryPolicy = RetryPolicy(self.options)
+
+        self.google = Google(self.options)
+        self.google.serpCache = self.serpCache
+        self.google.api.rateLimiter = self.rateLimiter
+        self.google.api.retryPolicy = self.retryPolicy
+        # every google object shares the internet object, so they share the proxy scores too
+        self.google.internet.proxyPool = ProxyPool(self.google.internet, self.database, self.options)
+        self.rateLimiter.internet = self.google.internet
+
+        self.pageCache = PageCache(self.localDatabase, self.options)
+        # for the search results. connections are pooled so reusing it avoids new handshakes.
+        self.api = self.configureApi(Api('', self.options))
+
+        self.lock = threading.RLock()
+        self.threadData = threading.local()
+        self.jobQueue = JobQueue(self.database, self.options)
+        self.resultKeywords = ResultKeywords(self.database, self.options)
+
+        # optional. a faster way to find the domains that have certain keywords.
+        self.keywordBitmap = None
+
+        if get(self.options, 'keywordBitmap') and not self.isWorker():
+            try:
+                self.keywordBitmap = KeywordBitmap(self.localDatabase, self.options)
+            except ImportError:
+                self.log.error('The keyword bitmap needs numpy. Run "pip3 install numpy" to use it.')
+
+        # the part files of worker processes are temporary
+        self.outputWriter = OutputWriter(self.options['outputFile'], self.getOutputFields(), self.database, self.options, not self.isWorker())
+        self.inputRowCount = 0
+        # each worker process gets its share of the connections to a host, but at least one
+        self.hostLimiter = HostLimiter(helpers.getShare(int(get(self.options, 'maximumRequestsPerHost') or 1), int(get(self.options, 'workerCount') or 1), int(get(self.options, 'workerIndex') or 0)))
+
+        # google.search returns at most this many results
+        self.resultsPerSearch = 10
+        self.maximumQueryLength = int(get(self.options, 'maximumQueryLength') or 2000)
+
+        # rows that had a captcha. a heap of (time to try again, order added, batch).
+        self.deferred = []
+        self.deferredCount = 0
+        self.captchaAttempts = {}
+        self.captchaRetrySeconds = float(get(self.options, 'captchaRetrySeconds') or 60)
+        self.maximumCaptchaAttempts = int(get(self.options, 'maximumCaptchaAttempts') or 5)
\ No newline at end of file
@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# so "program" can be imported and relative paths like program/resources/tables.json work
+directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, directory)
+os.chdir(directory)
+
+from program.library.database import Database
+
+# an empty sqlite database with the program's tables
+@pytest.fixture
+def database(tmp_path):
+    result = Database(str(tmp_path / 'database.sqlite'))
+    result.makeTables('program/resources/tables.json')
+
+    yield result
+
+    result.close()
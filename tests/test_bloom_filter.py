@@ -0,0 +1,56 @@
+import types
+import logging
+
+from program.library.bloom_filter import BloomFilter
+from program.other.keyword_finder import KeywordFinder
+
+def test_added_items_are_always_found():
+    bloomFilter = BloomFilter(1000)
+
+    for i in range(0, 1000):
+        bloomFilter.add(f'company-{i}.com')
+
+    assert all(f'company-{i}.com' in bloomFilter for i in range(0, 1000))
+    assert len(bloomFilter) == 1000
+
+def test_false_positive_rate():
+    bloomFilter = BloomFilter(10000, 0.01)
+
+    for i in range(0, 10000):
+        bloomFilter.add(f'company-{i}.com')
+
+    falsePositives = sum(1 for i in range(0, 10000) if f'other-{i}.com' in bloomFilter)
+
+    # about 1%
+    assert falsePositives < 200
+
+def test_empty_filter_has_nothing():
+    bloomFilter = BloomFilter(0)
+
+    assert 'a.com' not in bloomFilter
+
+# only the parts of a keyword finder that alreadyDone uses
+def getKeywordFinder(database, bloomFilter):
+    return types.SimpleNamespace(doneUrls=bloomFilter, database=database, log=logging.getLogger())
+
+def test_false_positive_is_checked_in_the_database(database):
+    bloomFilter = BloomFilter(10)
+
+    # every item might be in the filter
+    bloomFilter.bits = bytearray(b'\xff' * len(bloomFilter.bits))
+
+    database.insert('result', {'id': 1, 'url': 'done.com'})
+
+    keywordFinder = getKeywordFinder(database, bloomFilter)
+
+    assert 'new.com' in bloomFilter
+    assert not KeywordFinder.alreadyDone(keywordFinder, 'new.com')
+    assert KeywordFinder.alreadyDone(keywordFinder, 'done.com')
+
+def test_not_in_filter_skips_the_database(database):
+    database.insert('result', {'id': 1, 'url': 'done.com'})
+
+    # the filter wasn't told about it, so the database isn't asked
+    keywordFinder = getKeywordFinder(None, BloomFilter(10))
+
+    assert not KeywordFinder.alreadyDone(keywordFinder, 'done.com')
@@ -0,0 +1,91 @@
+import sqlite3
+
+# what another process would see
+def getSavedUrls(database):
+    connection = sqlite3.connect(database.name)
+
+    try:
+        return [row[0] for row in connection.execute('select url from result order by id')]
+    finally:
+        connection.close()
+
+def getResult(i, url, keyword=''):
+    return {
+        'id': i,
+        'url': url,
+        'keyword': keyword
+    }
+
+def test_inserts_are_buffered_until_flush(database):
+    database.setWriteBehind(100, 1000)
+
+    database.insert('result', getResult(1, 'a.com'))
+    database.insert('result', getResult(2, 'b.com'))
+
+    assert getSavedUrls(database) == []
+
+    database.flush()
+
+    assert getSavedUrls(database) == ['a.com', 'b.com']
+
+def test_flushes_after_maximum_items(database):
+    database.setWriteBehind(3, 1000)
+
+    for i in range(1, 4):
+        database.insert('result', getResult(i, f'{i}.com'))
+
+    assert getSavedUrls(database) == ['1.com', '2.com', '3.com']
+
+def test_newest_buffered_row_wins(database):
+    database.setWriteBehind(100, 1000)
+
+    database.insert('result', getResult(1, 'a.com', 'first'))
+    database.insert('result', getResult(1, 'a.com', 'second'))
+
+    assert database.find('result', 'keyword', {'url': 'a.com'}) == {'keyword': 'second'}
+
+    database.flush()
+
+    assert database.getFirst('result', 'keyword', 'id = 1')['keyword'] == 'second'
+
+def test_find_sees_buffered_rows_without_flushing(database):
+    database.setWriteBehind(100, 1000)
+
+    database.insert('result', getResult(1, 'a.com'))
+
+    assert database.find('result', 'id, url', {'url': 'a.com'}) == {'id': 1, 'url': 'a.com'}
+    assert database.find('result', '*', {'url': 'missing.com'}) == {}
+    assert getSavedUrls(database) == []
+
+def test_read_of_buffered_table_flushes_first(database):
+    database.setWriteBehind(100, 1000)
+
+    database.insert('result', getResult(1, 'a.com'))
+
+    rows = database.execute('select url from result', True)
+
+    assert [row['url'] for row in rows] == ['a.com']
+
+def test_read_of_other_table_does_not_flush(database):
+    database.setWriteBehind(100, 1000)
+
+    database.insert('result', getResult(1, 'a.com'))
+    database.execute('select * from job', True)
+
+    assert getSavedUrls(database) == []
+
+def test_transaction_writes_buffered_rows_first(database):
+    database.setWriteBehind(100, 1000)
+
+    database.insert('result', getResult(1, 'a.com'))
+
+    # the buffered row is saved even if the transaction is rolled back
+    try:
+        with database.transaction():
+            database.execute("update result set keyword = 'changed' where id = 1")
+            raise ValueError()
+    except ValueError:
+        pass
+
+    assert getSavedUrls(database) == ['a.com']
+    assert database.getFirst('result', 'keyword', 'id = 1')['keyword'] == ''
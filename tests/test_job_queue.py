@@ -0,0 +1,134 @@
+from program.library.job_queue import JobQueue
+
+def getJobQueue(database, options=None):
+    return JobQueue(database, options or {})
+
+def getRows(count):
+    return [{'Ds Id': str(i), 'Ds Company Website': f'company-{i}.com'} for i in range(0, count)]
+
+def getStatuses(database):
+    return {int(row['id']): row['status'] for row in database.execute('select id, status from job', True)}
+
+def expireLeases(database):
+    database.execute("update job set leaseExpires = '2000-01-01 00:00:00'")
+
+def test_start_loads_the_rows(database):
+    jobQueue = getJobQueue(database)
+
+    assert jobQueue.start(lambda: getRows(5), 'input') == 5
+    assert jobQueue.getCounts()['pending'] == 5
+
+def test_start_resumes_same_input(database):
+    jobQueue = getJobQueue(database)
+    jobQueue.start(lambda: getRows(3), 'input')
+
+    jobId, inputRow = jobQueue.claim(1)[0]
+    jobQueue.markDone(*inputRow['job'])
+    jobQueue.flush()
+
+    jobQueue.claim(1)
+
+    # the job that was in progress is pending again, the one that was done stays done
+    jobQueue.start(lambda: getRows(3), 'input')
+
+    assert getStatuses(database) == {1: 'done', 2: 'pending', 3: 'pending'}
+
+def test_claim_gives_each_job_once(database):
+    jobQueue = getJobQueue(database)
+    jobQueue.start(lambda: getRows(5), 'input')
+
+    first = jobQueue.claim(3)
+    second = jobQueue.claim(3)
+
+    assert [jobId for jobId, inputRow in first] == [1, 2, 3]
+    assert [jobId for jobId, inputRow in second] == [4, 5]
+    assert jobQueue.claim(3) == []
+
+    assert first[0][1]['Ds Company Website'] == 'company-0.com'
+    assert first[0][1]['job'][0] == 1
+
+def test_expired_lease_is_claimed_again(database):
+    jobQueue = getJobQueue(database)
+    jobQueue.start(lambda: getRows(2), 'input')
+
+    jobQueue.claim(2)
+
+    assert jobQueue.claim(2) == []
+
+    expireLeases(database)
+
+    assert [jobId for jobId, inputRow in jobQueue.claim(2)] == [1, 2]
+
+def test_renewed_lease_is_not_claimed_again(database):
+    jobQueue = getJobQueue(database)
+    jobQueue.start(lambda: getRows(1), 'input')
+
+    jobQueue.claim(1)
+    expireLeases(database)
+    jobQueue.renewLeases()
+
+    assert jobQueue.claim(1) == []
+
+def test_finish_is_written_at_flush(database):
+    jobQueue = getJobQueue(database, {'databaseBatchSize': 100})
+    jobQueue.start(lambda: getRows(2), 'input')
+
+    jobs = jobQueue.claim(2)
+
+    jobQueue.markDone(*jobs[0][1]['job'])
+    jobQueue.markFailed(*jobs[1][1]['job'], 'error')
+
+    assert getStatuses(database) == {1: 'in-progress', 2: 'in-progress'}
+
+    jobQueue.flush()
+
+    assert getStatuses(database) == {1: 'done', 2: 'failed'}
+    assert jobQueue.getCounts() == {'pending': 0, 'in-progress': 0, 'done': 1, 'failed': 1}
+
+def test_stale_claim_cannot_finish_the_job(database):
+    jobQueue = getJobQueue(database)
+    jobQueue.start(lambda: getRows(1), 'input')
+
+    oldJob = jobQueue.claim(1)[0][1]['job']
+
+    # another worker takes it after the lease runs out
+    expireLeases(database)
+    newJob = jobQueue.claim(1)[0][1]['job']
+
+    jobQueue.markFailed(*oldJob, 'too late')
+    jobQueue.flush()
+
+    assert getStatuses(database) == {1: 'in-progress'}
+
+    jobQueue.markDone(*newJob)
+    jobQueue.flush()
+
+    assert getStatuses(database) == {1: 'done'}
+
+def test_job_is_done_only_after_buffered_results(database):
+    database.setWriteBehind(100, 1000)
+
+    jobQueue = getJobQueue(database)
+    jobQueue.start(lambda: getRows(1), 'input')
+
+    job = jobQueue.claim(1)[0][1]['job']
+
+    database.insert('result', {'id': 1, 'url': 'company-0.com'})
+    jobQueue.markDone(*job)
+    jobQueue.flush()
+
+    assert database.pendingInserts == []
+    assert database.getFirst('result', 'url', 'id = 1')['url'] == 'company-0.com'
+
+def test_worker_only_claims_its_shard(database):
+    getJobQueue(database).start(lambda: getRows(20), 'input')
+
+    claimed = []
+
+    for i in range(0, 3):
+        jobQueue = getJobQueue(database, {'workerIndex': i, 'workerCount': 3})
+
+        claimed.append(set(jobId for jobId, inputRow in jobQueue.claim(100)))
+
+    assert set.union(*claimed) == set(range(1, 21))
+    assert sum(len(item) for item in claimed) == 20
@@ -0,0 +1,105 @@
+import csv
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+from program.library.keyword_bitmap import KeywordBitmap
+
+def getKeywordBitmap(database, tmp_path):
+    return KeywordBitmap(database, {'keywordBitmapDirectory': str(tmp_path / 'bitmap')})
+
+@pytest.fixture
+def keywordBitmap(database, tmp_path):
+    result = getKeywordBitmap(database, tmp_path)
+
+    result.set('a.com', '1', ['seo', 'php'])
+    result.set('b.com', '2', ['seo'])
+    result.set('c.com', '3', ['design'])
+
+    return result
+
+def test_counts(keywordBitmap):
+    assert keywordBitmap.getCounts() == {'seo': 2, 'php': 1, 'design': 1}
+    assert keywordBitmap.getCounts(['php', 'missing']) == {'php': 1}
+
+def test_set_replaces_the_keywords(keywordBitmap):
+    keywordBitmap.set('a.com', '1', ['design'])
+
+    assert keywordBitmap.getCounts() == {'seo': 1, 'php': 0, 'design': 2}
+    assert keywordBitmap.rowCount == 3
+
+def test_cooccurrence(keywordBitmap):
+    keywords, matrix = keywordBitmap.getCooccurrence(['seo', 'php'])
+
+    assert keywords == ['seo', 'php']
+    assert matrix.tolist() == [[2, 1], [1, 1]]
+
+def test_filter(keywordBitmap):
+    def getUrls(rows):
+        return [url for row, url, inputId in keywordBitmap.getDomains(rows)]
+
+    assert getUrls(keywordBitmap.filter(allKeywords=['seo'])) == ['a.com', 'b.com']
+    assert getUrls(keywordBitmap.filter(allKeywords=['seo'], noKeywords=['php'])) == ['b.com']
+    assert getUrls(keywordBitmap.filter(anyKeywords=['php', 'design'])) == ['a.com', 'c.com']
+    assert getUrls(keywordBitmap.filter(allKeywords=['missing'])) == []
+
+def test_grows_rows_and_keeps_existing_bits(database, tmp_path):
+    keywordBitmap = getKeywordBitmap(database, tmp_path)
+
+    # more than the 64 keywords and 1024 rows it starts with
+    keywords = [f'keyword {i}' for i in range(0, 70)]
+
+    keywordBitmap.set('first.com', '0', keywords)
+
+    for i in range(1, 1100):
+        keywordBitmap.set(f'{i}.com', str(i), ['keyword 0'])
+
+    counts = keywordBitmap.getCounts()
+
+    assert keywordBitmap.bytesPerRow > 8
+    assert keywordBitmap.capacity >= 1100
+    assert counts['keyword 0'] == 1100
+    assert counts['keyword 69'] == 1
+
+def test_reopened_bitmap_has_the_same_rows(database, tmp_path, keywordBitmap):
+    keywordBitmap.flush()
+
+    reopened = getKeywordBitmap(database, tmp_path)
+
+    assert reopened.getCounts() == {'seo': 2, 'php': 1, 'design': 1}
+
+    reopened.set('d.com', '4', ['php'])
+
+    assert reopened.rowCount == 4
+
+def test_update_adds_new_results(database, tmp_path):
+    keywordBitmap = getKeywordBitmap(database, tmp_path)
+
+    database.insert('result', {'id': 1, 'url': 'a.com', 'inputId': '1', 'keyword': 'seo;php'})
+    database.insert('result', {'id': 2, 'url': 'b.com', 'inputId': '2', 'keyword': ''})
+
+    keywordBitmap.update(database)
+
+    assert keywordBitmap.getCounts() == {'seo': 1, 'php': 1}
+
+    database.insert('result', {'id': 3, 'url': 'c.com', 'inputId': '3', 'keyword': 'seo'})
+
+    keywordBitmap.update(database)
+
+    assert keywordBitmap.getCounts() == {'seo': 2, 'php': 1}
+    assert keywordBitmap.rowCount == 3
+
+def test_export(keywordBitmap, tmp_path):
+    fileName = str(tmp_path / 'export.csv')
+
+    keywordBitmap.export(fileName, ['seo', 'php'], allKeywords=['seo'])
+
+    with open(fileName, encoding='utf-8', newline='') as file:
+        rows = list(csv.reader(file))
+
+    assert rows == [
+        ['Ds Id', 'Ds Company Website', 'seo', 'php'],
+        ['1', 'a.com', 'seo', 'php'],
+        ['2', 'b.com', 'seo', '']
+    ]
@@ -0,0 +1,55 @@
+from program.other.keyword_finder import KeywordFinder
+
+class RecordingKeywordFinder(KeywordFinder):
+    # remembers the rows instead of searching for them
+    async def searchAsync(self, inputRow, google, api):
+        self.searched.append(get(inputRow))
+        self.finishJob(inputRow, 'done')
+
+    def __init__(self, options, credentials):
+        super().__init__(options, credentials)
+
+        self.searched = []
+
+def get(inputRow):
+    return inputRow['Ds Company Website']
+
+def getKeywordFinder(tmp_path, options):
+    keywordsFile = tmp_path / 'keywords.txt'
+    keywordsFile.write_text('seo')
+
+    caseSensitiveFile = tmp_path / 'keywords-case-sensitive.txt'
+    caseSensitiveFile.write_text('')
+
+    newOptions = {
+        'inputFile': str(tmp_path / 'input.csv'),
+        'outputFile': str(tmp_path / 'output.csv'),
+        'keywordsFile': str(keywordsFile),
+        'keywordsCaseSensitiveFile': str(caseSensitiveFile),
+        'databaseFile': str(tmp_path / 'database.sqlite'),
+        'pageCacheDirectory': str(tmp_path / 'cache'),
+        'databaseType': 'sqlite'
+    }
+
+    newOptions.update(options)
+
+    return RecordingKeywordFinder(newOptions, {})
+
+def test_deferred_batch_is_tried_again_with_asyncio(tmp_path):
+    keywordFinder = getKeywordFinder(tmp_path, {'useAsync': 1, 'concurrency': 2})
+
+    keywordFinder.jobQueue.start(lambda: [{'Ds Id': '1', 'Ds Company Website': 'a.com'}], 'input')
+
+    jobId, inputRow = keywordFinder.jobQueue.claim(1)[0]
+
+    # the captcha's wait is already over
+    keywordFinder.deferred = [(0, 1, [(None, inputRow)])]
+
+    keywordFinder.processDeferred(2)
+    keywordFinder.jobQueue.flush()
+
+    assert keywordFinder.searched == ['a.com']
+    assert keywordFinder.deferred == []
+    assert keywordFinder.jobQueue.getCounts()['done'] == 1
+
+    keywordFinder.database.close()
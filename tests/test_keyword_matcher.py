@@ -0,0 +1,78 @@
+import random
+
+from program.library.keyword_matcher import KeywordMatcher
+
+# what KeywordMatcher has to give the same result as
+def getExpected(keywords, keywordsCaseSensitive, text):
+    results = [keyword for keyword in keywords if keyword.lower() in text.lower()]
+    results += [keyword for keyword in keywordsCaseSensitive if keyword in text]
+
+    return results
+
+def scanInPieces(matcher, text, sizes):
+    scanner = matcher.getScanner()
+    position = 0
+
+    for size in sizes:
+        scanner.feed(text[position:position + size])
+        position += size
+
+    scanner.feed(text[position:])
+
+    return scanner.getMatchingKeywords()
+
+def test_finds_keywords_in_one_piece():
+    matcher = KeywordMatcher(['Web Design', 'seo'], ['PHP'])
+
+    assert matcher.getMatchingKeywords('We do web design and php.') == ['Web Design']
+    assert matcher.getMatchingKeywords('SEO and PHP') == ['seo', 'PHP']
+
+def test_keyword_split_between_pieces():
+    matcher = KeywordMatcher(['web design'], ['PHP'])
+    text = 'we offer web design in PHP'
+
+    # every place a keyword can be cut in two
+    for i in range(0, len(text) + 1):
+        assert scanInPieces(matcher, text, [i]) == ['web design', 'PHP'], i
+
+def test_one_character_at_a_time():
+    matcher = KeywordMatcher(['abcab', 'bca', 'cab'], ['ABC'])
+    text = 'xxabcabxxABCx'
+
+    assert scanInPieces(matcher, text, [1] * len(text)) == getExpected(['abcab', 'bca', 'cab'], ['ABC'], text)
+
+def test_partial_match_at_end_of_piece_is_not_a_match():
+    matcher = KeywordMatcher(['keyword'], [])
+    scanner = matcher.getScanner()
+
+    scanner.feed('a keywor')
+
+    assert scanner.getMatchingKeywords() == []
+
+    scanner.feed('x keyword')
+
+    assert scanner.getMatchingKeywords() == ['keyword']
+
+def test_lowercase_changes_length():
+    # "İ".lower() is two characters
+    matcher = KeywordMatcher(['i̇stanbul'], [])
+
+    assert scanInPieces(matcher, 'in İstanbul', [4]) == ['i̇stanbul']
+
+def test_empty_keyword_is_always_found():
+    matcher = KeywordMatcher(['', 'missing'], [])
+
+    assert matcher.getMatchingKeywords('text') == ['']
+
+def test_random_pieces_match_plain_search():
+    generator = random.Random(1)
+    keywords = ['ab', 'abc', 'bcd', 'Cd', 'dab']
+    keywordsCaseSensitive = ['aB', 'DA']
+
+    for i in range(0, 300):
+        text = ''.join(generator.choice('abcdABCD ') for j in range(0, 40))
+        sizes = [generator.randint(0, 5) for j in range(0, 10)]
+
+        matcher = KeywordMatcher(keywords, keywordsCaseSensitive)
+
+        assert scanInPieces(matcher, text, sizes) == getExpected(keywords, keywordsCaseSensitive, text), text
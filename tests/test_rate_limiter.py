@@ -0,0 +1,51 @@
+import types
+
+from program.library import helpers
+from program.library.rate_limiter import RateLimiter
+from program.library.retry_policy import RetryPolicy
+
+def getOptions(workerCount, workerIndex, options):
+    result = {
+        'workerCount': workerCount,
+        'workerIndex': workerIndex
+    }
+
+    result.update(options)
+
+    return result
+
+def test_shares_add_up_to_the_limit():
+    for limit in range(0, 20):
+        for count in range(1, 20):
+            shares = [helpers.getShare(limit, count, index) for index in range(0, count)]
+
+            assert sum(shares) == limit
+            assert max(shares) - min(shares) <= 1
+
+def test_host_limits_are_shared_between_workers():
+    options = {'requestsPerSecondPerHost': 4, 'burstPerHost': 1, 'hostRateLimits': 'google.com=0.4'}
+
+    rateLimiters = [RateLimiter(getOptions(4, i, options)) for i in range(0, 4)]
+
+    assert sum(rateLimiter.hostRate for rateLimiter in rateLimiters) == 4
+    assert sum(rateLimiter.hostBurst for rateLimiter in rateLimiters) == 1
+    assert abs(sum(rateLimiter.rateByHost['google.com'] for rateLimiter in rateLimiters) - 0.4) < 0.0001
+
+def test_proxy_limits_are_shared_unless_the_list_was_split():
+    options = {'requestsPerSecondPerProxy': 2, 'burstPerProxy': 3}
+
+    rateLimiters = [RateLimiter(getOptions(2, i, options)) for i in range(0, 2)]
+    buckets = [rateLimiter.getProxyBucket() for rateLimiter in rateLimiters]
+
+    assert [bucket.rate for bucket in buckets] == [1, 1]
+    assert [bucket.burst for bucket in buckets] == [2, 1]
+
+    rateLimiters[0].internet = types.SimpleNamespace(splitProxies=True)
+    bucket = rateLimiters[0].getProxyBucket()
+
+    assert (bucket.rate, bucket.burst) == (2, 3)
+
+def test_retry_budget_is_shared_between_workers():
+    budgets = [RetryPolicy(getOptions(3, i, {'maximumRetriesPerRun': 10})).maximumRetries for i in range(0, 3)]
+
+    assert budgets == [4, 3, 3]